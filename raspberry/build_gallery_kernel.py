@@ -0,0 +1,36 @@
+"""
+Build the C gallery scan (gallery_kernel.c) into the _gallery_kernel extension module.
+GalleryIndex uses it automatically when the module can be imported (and faiss is not installed).
+Usage: cd raspberry && python build_gallery_kernel.py
+Requires cffi and a C compiler (sudo apt install build-essential python3-dev && pip install cffi).
+"""
+
+from pathlib import Path
+
+from cffi import FFI
+
+HERE = Path(__file__).resolve().parent
+
+
+def main() -> int:
+    ffi = FFI()
+    ffi.cdef(
+        """
+        float best_score(const float *matrix, int n, int dim, const float *query, int *out_idx);
+        float best_score_f16(const uint16_t *matrix, int n, int dim, const float *query, int *out_idx);
+        float best_score_i8(const int8_t *matrix, const float *row_factor, int n, int dim, const int8_t *query, int *out_idx);
+        """
+    )
+    ffi.set_source(
+        "_gallery_kernel",
+        (HERE / "gallery_kernel.c").read_text(),
+        # -march=native: the module is built on the Pi it runs on
+        extra_compile_args=["-O3", "-march=native", "-ffast-math"],
+    )
+    output = ffi.compile(tmpdir=str(HERE))
+    print(f"Built {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,48 @@
+#!/bin/bash
+# Build an OpenCV wheel tuned for the Raspberry Pi CPU (NEON/FP16 SIMD + TBB).
+# The generic wheels from PyPI may ship without these paths enabled; resize, cvtColor and
+# dnn.blobFromImage used by the recognizers are the main beneficiaries.
+# The build takes 1-2 hours on a Pi 4; run it once and keep the resulting wheel.
+set -e
+
+OPENCV_PYTHON_TAG="${OPENCV_PYTHON_TAG:-78}"  # opencv-python 4.8.1.78, same as requirements.txt
+BUILD_DIR="${BUILD_DIR:-$HOME/opencv-build}"
+
+echo "Installing build dependencies..."
+sudo apt-get update
+sudo apt-get install -y --no-install-recommends \
+    build-essential cmake git pkg-config \
+    libtbb-dev libjpeg-dev libpng-dev \
+    libavcodec-dev libavformat-dev libswscale-dev libv4l-dev
+
+echo "Cloning opencv-python (tag $OPENCV_PYTHON_TAG) into $BUILD_DIR..."
+mkdir -p "$BUILD_DIR"
+cd "$BUILD_DIR"
+if [ ! -d opencv-python ]; then
+    git clone --recursive --branch "$OPENCV_PYTHON_TAG" https://github.com/opencv/opencv-python.git
+fi
+cd opencv-python
+
+CMAKE_ARGS="-DENABLE_NEON=ON -DCPU_BASELINE=NEON,FP16 -DWITH_TBB=ON -DWITH_FFMPEG=ON -DWITH_V4L=ON"
+CMAKE_ARGS="$CMAKE_ARGS -DBUILD_LIST=core,imgproc,imgcodecs,dnn,videoio,python3"
+CMAKE_ARGS="$CMAKE_ARGS -DBUILD_TESTS=OFF -DBUILD_PERF_TESTS=OFF -DBUILD_EXAMPLES=OFF"
+# VFPv3 only exists on 32-bit ARM; on aarch64 it is part of the baseline
+if [ "$(uname -m)" = "armv7l" ]; then
+    CMAKE_ARGS="$CMAKE_ARGS -DENABLE_VFPV3=ON"
+fi
+export CMAKE_ARGS
+export ENABLE_HEADLESS=1
+export MAKEFLAGS="-j$(nproc)"
+
+echo "Building wheel (CMAKE_ARGS=$CMAKE_ARGS)..."
+pip wheel . --no-deps --wheel-dir "$BUILD_DIR/wheels" --verbose
+
+echo "Replacing opencv-python-headless with the local build..."
+pip uninstall -y opencv-python-headless opencv-python || true
+pip install "$BUILD_DIR"/wheels/opencv_python_headless-*.whl
+
+echo ""
+echo "✓ OpenCV build completed!"
+echo ""
+echo "To verify NEON is enabled, run:"
+echo "  python -c \"import cv2; print(cv2.getBuildInformation())\" | grep -A3 'CPU/HW features'"
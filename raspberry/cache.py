@@ -1,16 +1,254 @@
-import json
+import argparse
+import logging
+import os
+import time
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Pi image without orjson falls back to stdlib json
+    orjson = None
+    import json
+
+try:
+    import ijson
+except ImportError:  # without ijson large caches are parsed in one go
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+# Journal size above which append_embeddings folds it back into the snapshot
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+# Cache files above this size are parsed incrementally with ijson
+STREAM_LOAD_BYTES = 1_000_000
+
+
+def _vectors_path(p: Path, generation: Optional[str] = None) -> Path:
+    # raspberry_cache.json -> raspberry_cache.embeddings.<generation>.npy
+    # (raspberry_cache.embeddings.npy for caches written before generations)
+    if generation is None:
+        return p.with_name(f"{p.stem}.embeddings.npy")
+    return p.with_name(f"{p.stem}.embeddings.{generation}.npy")
+
+
+def _write_atomic(path: Path, write: Callable[[BinaryIO], None]) -> None:
+    """
+    Write through a temp file that is fsynced and renamed over path, then fsync the
+    directory: after a crash path holds either the old or the new content, never a mix.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _journal_path(p: Path) -> Path:
+    # raspberry_cache.json -> raspberry_cache.embeddings.jsonl
+    return p.with_name(f"{p.stem}.embeddings.jsonl")
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dump(payload: Dict[str, Any], f: BinaryIO, *, pretty: bool = False) -> None:
+    """Serialize payload into f; compact unless pretty is requested (debugging, hand-made caches)."""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        f.write(orjson.dumps(payload, option=option))
+    elif pretty:
+        f.write(json.dumps(payload, indent=2).encode("utf-8"))
+    else:
+        f.write(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def _load_streaming(p: Path) -> Dict[str, Any]:
+    """
+    Parse the cache event by event: top-level values are built one at a time and each
+    embedding record is finished (inline vector packed into float32) before the next one
+    is read, so a cache with vectors still in the JSON never exists as lists of Python floats.
+    """
+    payload: Dict[str, Any] = {}
+    key = None
+    builder = None
+    with p.open("rb") as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == "":
+                if event == "map_key":
+                    key = value
+                continue
+            if key == "embeddings" and prefix == "embeddings":
+                if event == "start_array":
+                    payload["embeddings"] = []
+                continue
+            if builder is None:
+                builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if key == "embeddings" and prefix == "embeddings.item" and event == "end_map":
+                record = builder.value
+                if "vector" in record:
+                    record["vector"] = np.asarray(record["vector"], dtype=np.float32)
+                payload["embeddings"].append(record)
+                builder = None
+            elif prefix == key and event not in ("start_map", "start_array", "map_key"):
+                payload[key] = builder.value
+                builder = None
+    return payload
 
 
 def load_cache(path: str) -> Dict[str, Any]:
     p = Path(path)
     if not p.exists():
-        return {"embeddings": [], "users": [], "access_windows": [], "photos": []}
-    return json.loads(p.read_text())
+        payload: Dict[str, Any] = {"embeddings": [], "users": [], "access_windows": [], "photos": []}
+    elif ijson is not None and p.stat().st_size > STREAM_LOAD_BYTES:
+        payload = _load_streaming(p)
+    else:
+        payload = _loads(p.read_bytes())
 
+    embeddings = payload.setdefault("embeddings", [])
+    # {"generation", "rows"} of the sidecar this snapshot was written with
+    meta = payload.pop("vectors", None) or {}
+    if any("row" in e for e in embeddings):
+        vectors_path = _vectors_path(p, meta.get("generation"))
+        vectors = np.load(vectors_path, mmap_mode="r") if vectors_path.exists() else None
+        if vectors is None or ("rows" in meta and vectors.shape[0] != meta["rows"]):
+            logger.warning("Embeddings sidecar %s is missing or does not match the cache, dropping stored embeddings", vectors_path)
+            embeddings = payload["embeddings"] = [e for e in embeddings if "vector" in e]
+        else:
+            # mmap keeps RSS flat regardless of the number of enrolled embeddings
+            for emb in embeddings:
+                if "row" in emb:
+                    emb["vector"] = vectors[emb.pop("row")]
 
-def save_cache(path: str, payload: Dict[str, Any]) -> None:
+    # Replay embeddings appended since the last snapshot, one record per line
+    journal_path = _journal_path(p)
+    if journal_path.exists():
+        with journal_path.open("rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = _loads(line)
+                except ValueError:
+                    logger.warning("Skipping unreadable line in %s", journal_path)
+                    continue
+                record["vector"] = np.asarray(record["vector"], dtype=np.float32)
+                embeddings.append(record)
+    return payload
+
+
+def _split_vectors(embeddings: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[np.ndarray]]:
+    """
+    Move embedding vectors out of the JSON records into rows for the sidecar.
+    Vectors whose dimension differs from the first non-empty one (e.g. left over from
+    another model) stay inline in the record; records without a vector are kept as they are.
+    """
+    records: List[Dict[str, Any]] = []
+    rows: List[np.ndarray] = []
+    dim = None
+    for emb in embeddings:
+        vector = np.asarray(emb.get("vector", ()), dtype=np.float32).reshape(-1)
+        if vector.shape[0] == 0:
+            record = dict(emb)
+            if "vector" in record:
+                record["vector"] = []  # an empty ndarray is not JSON serializable without orjson
+            records.append(record)
+            continue
+        if dim is None:
+            dim = vector.shape[0]
+        record = {k: v for k, v in emb.items() if k != "vector"}
+        if vector.shape[0] == dim:
+            record["row"] = len(rows)
+            rows.append(vector)
+        else:
+            record["vector"] = vector.tolist()
+        records.append(record)
+    return records, rows
+
+
+def save_cache(path: str, payload: Dict[str, Any], pretty: bool = False) -> None:
     p = Path(path)
     p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(payload, indent=2))
+
+    # Vectors go to a packed float16 .npy next to the JSON metadata. Each snapshot gets a
+    # sidecar of its own generation, written before the JSON that refers to it: until the
+    # JSON is replaced, the old JSON and its old sidecar stay a consistent pair on disk.
+    records, rows = _split_vectors(payload.get("embeddings", []))
+    payload = {**payload, "embeddings": records}
+    vectors_path = None
+    if rows:
+        generation = f"{time.time_ns():x}"
+        vectors_path = _vectors_path(p, generation)
+        matrix = np.ascontiguousarray(np.stack(rows), dtype=np.float16)
+        _write_atomic(vectors_path, lambda f: np.save(f, matrix))
+        payload["vectors"] = {"generation": generation, "rows": len(rows)}
+    else:
+        payload.pop("vectors", None)
+
+    _write_atomic(p, lambda f: _dump(payload, f, pretty=pretty))
+
+    # Sidecars of earlier snapshots (a previous load may still hold one mmapped; unlinking is fine)
+    for old in p.parent.glob(f"{p.stem}.embeddings.*npy"):
+        if old != vectors_path:
+            old.unlink(missing_ok=True)
+    # The snapshot now holds everything, so the journal starts over
+    _journal_path(p).unlink(missing_ok=True)
+
+
+def append_embeddings(path: str, entries: Iterable[Dict[str, Any]]) -> None:
+    """
+    Append embeddings to the journal next to the cache instead of rewriting the whole cache.
+    The journal is folded into the snapshot by save_cache(), or by compact() once it grows
+    past JOURNAL_COMPACT_BYTES.
+    """
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    journal_path = _journal_path(p)
+    with journal_path.open("ab") as f:
+        for entry in entries:
+            record = {**entry, "vector": np.asarray(entry["vector"], dtype=np.float32)}
+            if orjson is not None:
+                f.write(orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+            else:
+                record["vector"] = record["vector"].tolist()
+                f.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    if journal_path.stat().st_size > JOURNAL_COMPACT_BYTES:
+        compact(path)
+
+
+def compact(path: str, pretty: bool = False) -> None:
+    """Fold the embeddings journal into a fresh cache snapshot (written atomically by save_cache())."""
+    save_cache(path, load_cache(path), pretty=pretty)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Raspberry cache maintenance")
+    parser.add_argument("--path", default="raspberry_cache.json", help="Cache file path")
+    parser.add_argument("--compact", action="store_true", help="Fold the embeddings journal into the snapshot")
+    parser.add_argument("--pretty", action="store_true", help="Write the snapshot indented (for reading by hand)")
+    args = parser.parse_args()
+    if args.compact:
+        compact(args.path, pretty=args.pretty)
+        print(f"Compacted {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
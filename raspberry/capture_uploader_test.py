@@ -1,8 +1,17 @@
 import argparse
 import logging
 from datetime import datetime
+from typing import List, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
 
 from config import PiSettings
 from usb_camera_client import USBCameraClient
@@ -10,25 +19,82 @@ from usb_camera_client import USBCameraClient
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
+# Keep-alive connection pool shared by all uploads: later requests skip the TCP/TLS handshake.
+# Only failed connections are retried: the request never reached the server then. After a
+# read timeout or a gateway 502/504 the upload may already be stored, and a retry would
+# store it twice.
+_RETRY = Retry(
+    total=3,
+    connect=3,
+    read=0,
+    status=0,
+    other=0,
+    backoff_factor=0.3,
+    allowed_methods=frozenset({"POST"}),
+)
+_SESSION = requests.Session()
+_SESSION.headers["Connection"] = "keep-alive"
+_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=_RETRY))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=_RETRY))
+
+
+# Reused for every single-frame capture so the capture path does not allocate per frame
+_FRAME_BUFFER = bytearray(2 * 1024 * 1024)
 
-def capture_frame(device_index: int) -> bytes:
+
+def capture_frame(device_index: int) -> memoryview:
+    """Capture one JPEG into _FRAME_BUFFER; the returned view is valid until the next call."""
     camera = USBCameraClient(device_index)
     try:
-        frame = camera.read_frame()
-        if not frame:
+        size = camera.read_frame_into(_FRAME_BUFFER)
+        if not size:
             raise RuntimeError("No frame captured from USB camera")
-        _, frame_bytes = frame
-        return frame_bytes
+        return memoryview(_FRAME_BUFFER)[:size]
     finally:
         camera.release()
 
 
-def send_to_server(api_base_url: str, device_id: str, person_name: str, frame_bytes: bytes) -> dict:
+def capture_frames(device_index: int, count: int) -> List[bytes]:
+    camera = USBCameraClient(device_index)
+    try:
+        frames = []
+        for _ in range(count):
+            frame_bytes = camera.read_frame()
+            if frame_bytes is None:
+                raise RuntimeError("No frame captured from USB camera")
+            frames.append(frame_bytes)
+        return frames
+    finally:
+        camera.release()
+
+
+def send_to_server(api_base_url: str, device_id: str, person_name: str, frame_bytes: Union[bytes, memoryview]) -> dict:
     url = api_base_url.rstrip("/") + "/raspberry/upload-capture"
     data = {"person_name": person_name, "captured_at": datetime.utcnow().isoformat()}
     headers = {"X-Device-Id": device_id}
-    files = {"image": ("capture.jpg", frame_bytes, "image/jpeg")}
-    response = requests.post(url, data=data, files=files, headers=headers, timeout=15)
+    # The multipart body needs its own copy anyway, so a memoryview is materialized only here
+    files = {"image": ("capture.jpg", bytes(frame_bytes), "image/jpeg")}
+    response = _SESSION.post(url, data=data, files=files, headers=headers, timeout=15)
+    response.raise_for_status()
+    return response.json()
+
+
+def send_batch_to_server(api_base_url: str, device_id: str, items: List[Tuple[str, bytes]]) -> dict:
+    """
+    Upload several captures in one multipart POST: repeated "image" parts plus a JSON "meta" part
+    whose i-th entry describes the i-th image.
+
+    Args:
+        items: (person_name, jpeg bytes) pairs
+    """
+    url = api_base_url.rstrip("/") + "/raspberry/upload-capture-batch"
+    captured_at = datetime.utcnow().isoformat()
+    meta = [{"person_name": person_name, "captured_at": captured_at} for person_name, _ in items]
+    meta_bytes = orjson.dumps(meta) if orjson is not None else json.dumps(meta).encode("utf-8")
+    files = [("image", (f"{i}.jpg", frame_bytes, "image/jpeg")) for i, (_, frame_bytes) in enumerate(items)]
+    files.append(("meta", (None, meta_bytes, "application/json")))
+    headers = {"X-Device-Id": device_id}
+    response = _SESSION.post(url, files=files, headers=headers, timeout=30)
     response.raise_for_status()
     return response.json()
 
@@ -39,13 +105,23 @@ def main():
     parser.add_argument("--server", dest="server", help="API base URL of the backend.")
     parser.add_argument("--device-id", dest="device_id", help="Device id header value.")
     parser.add_argument("--camera-index", dest="camera_index", type=int, help="USB camera index.")
+    parser.add_argument("--count", type=int, default=1, help="Number of frames; more than one is sent as a single batch.")
     args = parser.parse_args()
 
-    settings = PiSettings()
+    settings = PiSettings.load()
     api_base_url = args.server or settings.api_base_url
     device_id = args.device_id or settings.device_id
     camera_index = args.camera_index if args.camera_index is not None else settings.usb_device_index
 
+    if args.count > 1:
+        logger.info("Capturing %s frames from USB camera index=%s", args.count, camera_index)
+        frames = capture_frames(camera_index, args.count)
+        logger.info("Captured %s frames, sending batch to %s", len(frames), api_base_url)
+        payload = send_batch_to_server(api_base_url, device_id, [(args.name, f) for f in frames])
+        logger.info("Server response: %s", payload)
+        print(payload)
+        return
+
     logger.info("Capturing frame from USB camera index=%s", camera_index)
     frame_bytes = capture_frame(camera_index)
     logger.info("Captured %s bytes, sending to %s", len(frame_bytes), api_base_url)
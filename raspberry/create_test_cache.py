@@ -3,10 +3,13 @@
 Create a test cache file for offline testing.
 This allows you to test face recognition and GPIO without server connection.
 """
-import json
 import sys
 from pathlib import Path
 
+import numpy as np
+
+from cache import save_cache
+
 def create_test_cache():
     """Create a minimal test cache file"""
 
@@ -34,8 +37,8 @@ def create_test_cache():
                 "person_name": "test_user",
                 "model_name": "insightface",
                 "filename": "test.jpg",
-                # Random 512-dim vector (will not match any real face)
-                "vector": [0.0] * 512
+                # Zero 512-dim vector (will not match any real face), stored in the .npy sidecar
+                "vector": np.zeros(512, dtype=np.float16)
             }
         ],
         "access_windows": [],
@@ -49,7 +52,7 @@ def create_test_cache():
 
     # Save to file
     cache_path = Path(__file__).parent / "raspberry_cache.json"
-    cache_path.write_text(json.dumps(cache, indent=2))
+    save_cache(str(cache_path), cache, pretty=True)
 
     print(f"✓ Test cache created at: {cache_path}")
     print(f"  - Users: {len(cache['users'])}")
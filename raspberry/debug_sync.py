@@ -16,7 +16,7 @@ def main() -> int:
     parser.add_argument("--limit", type=int, default=3, help="How many photos to try downloading")
     args = parser.parse_args()
 
-    settings = PiSettings()
+    settings = PiSettings.load()
     if args.server:
         settings.api_base_url = args.server
 
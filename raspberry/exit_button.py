@@ -1,6 +1,7 @@
 import logging
 import threading
 import time
+from datetime import timedelta
 from typing import Callable, Optional
 
 logger = logging.getLogger(__name__)
@@ -40,7 +41,6 @@ class ExitButton:
         self.thread: Optional[threading.Thread] = None
         self.mode = "none"
         self.line_request = None
-        self._last_press_time = 0.0
 
     def start(self) -> None:
         """Start monitoring the exit button in a background thread"""
@@ -90,11 +90,14 @@ class ExitButton:
                     logger.error("Cannot open GPIO chip for exit button")
                     return False
 
-                # Configure as INPUT with PULL_UP (button connects to GND)
+                # Configure as INPUT with PULL_UP (button connects to GND).
+                # Press = falling edge; debounce is done by the kernel.
                 line_config = {
                     self.pin: gpiod.LineSettings(
                         direction=gpiod.line.Direction.INPUT,
                         bias=gpiod.line.Bias.PULL_UP,  # Pull-up resistor
+                        edge_detection=gpiod.line.Edge.FALLING,
+                        debounce_period=timedelta(milliseconds=self.debounce_ms),
                     )
                 }
 
@@ -116,37 +119,26 @@ class ExitButton:
         return False
 
     def _monitor_button(self) -> None:
-        """Monitor button state in a loop (runs in background thread)"""
-        import gpiod  # type: ignore
-
+        """Wait for button edge events (runs in background thread)"""
         logger.info("Exit button monitoring started")
 
         while self.running:
             try:
-                if self.mode == "v2" and self.line_request:
-                    # Read button state (LOW = pressed, HIGH = released)
-                    value = self.line_request.get_value(self.pin)
-
-                    # Button pressed (connected to GND, so value is INACTIVE/0)
-                    if value == gpiod.line.Value.INACTIVE:
-                        current_time = time.time()
-
-                        # Debounce: ignore if pressed too soon after last press
-                        if current_time - self._last_press_time > (self.debounce_ms / 1000):
-                            logger.info("🔘 Exit button pressed!")
-                            self._last_press_time = current_time
-
-                            # Call the callback (trigger door unlock)
-                            try:
-                                self.on_press()
-                            except Exception as exc:
-                                logger.error("Error in exit button callback: %s", exc)
-
-                            # Wait a bit to avoid multiple triggers
-                            time.sleep(self.debounce_ms / 1000)
-
-                # Small delay to avoid CPU spinning
-                time.sleep(0.05)  # Check button every 50ms
+                if self.mode != "v2" or not self.line_request:
+                    break
+
+                # Blocks in the kernel until an edge arrives; the timeout only lets stop() take effect
+                if not self.line_request.wait_edge_events(timeout=timedelta(seconds=1)):
+                    continue
+
+                for _ in self.line_request.read_edge_events():
+                    logger.info("🔘 Exit button pressed!")
+
+                    # Call the callback (trigger door unlock)
+                    try:
+                        self.on_press()
+                    except Exception as exc:
+                        logger.error("Error in exit button callback: %s", exc)
 
             except Exception as exc:
                 logger.error("Error monitoring exit button: %s", exc)
@@ -1,16 +1,71 @@
+import functools
 import io
 import logging
+import os
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 import numpy as np
 import onnxruntime as ort
 from PIL import Image
 
-from model_registry import BaseRecognizer
+try:
+    import cv2
+
+    from jpeg_codec import JpegDecoder
+except ImportError:  # Pillow fallback below keeps FaceNet usable without OpenCV
+    cv2 = None
+
+try:
+    import numba
+except ImportError:  # numba is optional, cv2.dnn.blobFromImage is used without it
+    numba = None
+
+from model_registry import XNNPACK_PROVIDER, BaseRecognizer, onnx_provider_options, onnx_providers
 
 logger = logging.getLogger(__name__)
 
+# FaceNet input side; a module constant so numba compiles the loops for this exact shape
+_INPUT_SIZE = 160
+
+if numba is not None:
+
+    @numba.njit(cache=True, fastmath=True, boundscheck=False)
+    def _preproc_kernel(bgr, out):
+        """BGR uint8 HWC (160x160x3) -> RGB float32 NCHW with (x - 127.5) / 128, written into out."""
+        for y in range(_INPUT_SIZE):
+            for x in range(_INPUT_SIZE):
+                for c in range(3):
+                    out[0, c, y, x] = (np.float32(bgr[y, x, 2 - c]) - np.float32(127.5)) * np.float32(1.0 / 128.0)
+
+else:
+    _preproc_kernel = None
+
+
+@functools.lru_cache(maxsize=4)
+def _build_session(path: str, providers: Tuple[str, ...]) -> ort.InferenceSession:
+    """
+    Build (once per model path/providers) a tuned InferenceSession.
+    Re-creating a recognizer reuses the already loaded and optimized model.
+    """
+    sess_options = ort.SessionOptions()
+    sess_options.enable_mem_pattern = True
+    sess_options.enable_cpu_mem_arena = True
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if XNNPACK_PROVIDER in providers:
+        # XNNPACK runs its own thread pool; keep ORT's small and non-spinning so they don't compete
+        sess_options.intra_op_num_threads = 1
+        sess_options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    else:
+        sess_options.intra_op_num_threads = os.cpu_count() or 4
+    return ort.InferenceSession(
+        path,
+        sess_options=sess_options,
+        providers=list(providers),
+        provider_options=onnx_provider_options(list(providers)),
+    )
+
 
 class FaceNetRecognizer(BaseRecognizer):
     """
@@ -23,33 +78,66 @@ class FaceNetRecognizer(BaseRecognizer):
     def __init__(self, model_path: str, providers: Optional[list[str]] = None):
         resolved = self._resolve_model_path(model_path)
         self.model_path = resolved
-        # На Raspberry чаще всего доступен только CPUExecutionProvider
-        provider_list = providers or ["CPUExecutionProvider"]
-        self.session = ort.InferenceSession(
-            str(resolved),
-            providers=provider_list,
-        )
+        # XNNPACK если onnxruntime собран с ним, иначе CPUExecutionProvider
+        provider_list = providers or onnx_providers()
+        self.session = _build_session(str(resolved), tuple(provider_list))
         self.input_name = self.session.get_inputs()[0].name
+
+        # Persistent input/output buffers bound once: run_with_iobinding reads the input
+        # in place and writes the embedding into the same output buffer on every call.
+        output = self.session.get_outputs()[0]
+        output_shape = [dim if isinstance(dim, int) else 1 for dim in output.shape]
+        self._input_buffer = np.zeros((1, 3, _INPUT_SIZE, _INPUT_SIZE), dtype=np.float32)
+        self._output_buffer = np.zeros(output_shape, dtype=np.float32)
+        self.embedding_dim = int(self._output_buffer.size)
+        self._input_value = ort.OrtValue.ortvalue_from_numpy(self._input_buffer, "cpu")
+        self._io_binding = self.session.io_binding()
+        self._io_binding.bind_ortvalue_input(self.input_name, self._input_value)
+        self._io_binding.bind_output(
+            output.name, "cpu", 0, np.float32, output_shape, self._output_buffer.ctypes.data
+        )
+        # Buffers are shared, so embed() calls must not interleave
+        self._lock = threading.Lock()
+        self._decoder = JpegDecoder() if cv2 is not None else None
+        self._use_kernel = _preproc_kernel is not None and cv2 is not None
+        if self._use_kernel:
+            # Compile (or load from the numba cache) now rather than on the first face at the door
+            _preproc_kernel(np.zeros((_INPUT_SIZE, _INPUT_SIZE, 3), dtype=np.uint8), self._input_buffer)
         logger.info(
-            "FaceNetRecognizer loaded ONNX model from %s (providers=%s)",
+            "FaceNetRecognizer loaded ONNX model from %s (providers=%s, numba preprocess=%s)",
             resolved,
             provider_list,
+            self._use_kernel,
         )
 
     @staticmethod
     def _resolve_model_path(model_path: str) -> Path:
-        candidates = [
+        bases = [
             Path(model_path),
             Path(__file__).resolve().parent / model_path,
         ]
+        # Prefer the int8 model produced by quantize_facenet.py (facenet.onnx -> facenet.int8.onnx)
+        candidates = []
+        for base in bases:
+            if not base.name.endswith(".int8.onnx"):
+                candidates.append(base.with_suffix(".int8.onnx"))
+            candidates.append(base)
         for candidate in candidates:
             if candidate.exists():
                 return candidate
         raise FileNotFoundError(f"FaceNet ONNX model not found. Tried: {[str(c) for c in candidates]}")
 
+    def _decode(self, image_bytes: bytes) -> np.ndarray:
+        # Only 160x160 is needed, so large JPEGs are decoded at reduced scale
+        img = self._decoder.decode(image_bytes, min_side=_INPUT_SIZE)
+        if img is None:
+            raise ValueError("Failed to decode image")
+        return img
+
     def _preprocess(self, image_bytes: bytes) -> np.ndarray:
+        """Pillow preprocessing, used when OpenCV is not installed."""
         img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        img = img.resize((160, 160))
+        img = img.resize((_INPUT_SIZE, _INPUT_SIZE))
         arr = np.asarray(img).astype(np.float32)
         # fixed_image_standardization: (x - 127.5) / 128
         arr = (arr - 127.5) / 128.0
@@ -58,7 +146,34 @@ class FaceNetRecognizer(BaseRecognizer):
         return arr
 
     def embed(self, image_bytes: bytes) -> np.ndarray:
-        tensor = self._preprocess(image_bytes)
-        outputs = self.session.run(None, {self.input_name: tensor})
-        embedding = outputs[0]
-        return np.squeeze(embedding, axis=0).astype(np.float32)
+        if cv2 is not None:
+            return self.embed_frame(self._decode(image_bytes))
+        return self._run(self._preprocess(image_bytes))
+
+    def embed_frame(self, img: np.ndarray) -> np.ndarray:
+        if cv2 is None:
+            return super().embed_frame(img)
+        if self._use_kernel:
+            return self._run(None, cv2.resize(img, (_INPUT_SIZE, _INPUT_SIZE)))
+        # resize + BGR->RGB + (x - 127.5) / 128 + HWC->NCHW in a single pass
+        tensor = cv2.dnn.blobFromImage(
+            img,
+            scalefactor=1 / 128.0,
+            size=(_INPUT_SIZE, _INPUT_SIZE),
+            mean=(127.5, 127.5, 127.5),
+            swapRB=True,
+            crop=False,
+        )
+        return self._run(tensor)
+
+    def _run(self, tensor: Optional[np.ndarray], img: Optional[np.ndarray] = None) -> np.ndarray:
+        """Run the model on a NCHW tensor, or on a 160x160 BGR image normalized by the numba kernel."""
+        with self._lock:
+            if img is not None:
+                # Normalize straight into the bound input buffer
+                _preproc_kernel(img, self._input_buffer)
+            else:
+                np.copyto(self._input_buffer, tensor)
+            self.session.run_with_iobinding(self._io_binding)
+            # Copy out: the output buffer is overwritten by the next call
+            return self._output_buffer.reshape(-1).copy()
@@ -0,0 +1,168 @@
+import logging
+import queue
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# While the camera keeps failing, capture warnings are logged at most this often
+WARN_INTERVAL_SEC = 5.0
+
+
+def gil_enabled() -> bool:
+    """False when running on a free-threaded (3.13t+) interpreter with the GIL actually off."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled else True
+
+
+class FrameGrabber:
+    """
+    Reads frames from a camera client (RTSPClient / USBCameraClient) in a daemon thread,
+    so capture overlaps with recognition instead of running before it.
+
+    Frames go through a single-slot queue: a frame nobody picked up yet is replaced by the
+    newer one, so the consumer always gets the freshest frame.
+
+    Clients with read_frame_array() (RTSPClient, USBCameraClient) hand over decoded BGR frames,
+    the others JPEG bytes; AccessController.process_frame() takes either. A USB camera in MJPEG
+    mode hands over its JPEG instead: the recognizer can decode it at a reduced scale.
+    """
+
+    def __init__(self, camera: Any, frame_skip: int = 1):
+        """
+        Args:
+            camera: Client exposing read_frame_array() -> Optional[ndarray]
+                or read_frame() -> Optional[bytes]
+            frame_skip: Hand over every N-th frame. Skipped frames are only grabbed
+                (not decoded) when the client has clear_buffer(), otherwise read and dropped
+        """
+        self.camera = camera
+        self.frame_skip = max(1, frame_skip)
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=1)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._reader, name="frame-grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Return the newest frame, waiting up to timeout seconds; None if nothing arrived."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear(self) -> None:
+        """Drop the frame waiting in the slot (e.g. one captured before the door opened)."""
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _reader(self) -> None:
+        skip_frames = getattr(self.camera, "clear_buffer", None)
+        read_array = getattr(self.camera, "read_frame_array", None)
+        last_warn = 0.0
+        while not self._stop.is_set():
+            # Re-checked per frame: USBCameraClient learns whether MJPEG is on when it connects
+            if read_array is None or getattr(self.camera, "mjpeg", False):
+                read_frame = self.camera.read_frame
+            else:
+                read_frame = read_array
+            try:
+                if self.frame_skip > 1:
+                    if skip_frames:
+                        skip_frames(num_frames=self.frame_skip - 1)
+                    else:
+                        for _ in range(self.frame_skip - 1):
+                            self.camera.read_frame()
+                frame_data = read_frame()
+            except Exception as exc:
+                if time.monotonic() - last_warn >= WARN_INTERVAL_SEC:
+                    last_warn = time.monotonic()
+                    logger.warning("Frame capture failed: %s", exc)
+                self._stop.wait(0.5)
+                continue
+            if frame_data is None:
+                if time.monotonic() - last_warn >= WARN_INTERVAL_SEC:
+                    last_warn = time.monotonic()
+                    logger.warning("No frame received")
+                self._stop.wait(0.1)
+                continue
+            # Replace a frame the consumer has not taken yet
+            self.clear()
+            try:
+                self._queue.put_nowait(frame_data)
+            except queue.Full:
+                pass
+
+
+class RecognitionWorker:
+    """
+    Runs controller.process_frame() on frames from a FrameGrabber in its own thread,
+    leaving the main thread to cloud sync and shutdown. ONNX Runtime releases the GIL
+    during inference, so capture, recognition and sync overlap.
+    """
+
+    def __init__(
+        self,
+        controller: Any,
+        grabber: FrameGrabber,
+        threshold: Optional[float] = None,
+        trigger_pause_sec: float = 0.0,
+    ):
+        """
+        Args:
+            controller: AccessController
+            grabber: Started FrameGrabber to take frames from
+            threshold: Match threshold passed to process_frame (None = settings.threshold)
+            trigger_pause_sec: Pause after the door was opened; the frame captured meanwhile is dropped
+        """
+        self.controller = controller
+        self.grabber = grabber
+        self.threshold = threshold
+        self.trigger_pause_sec = trigger_pause_sec
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        # A free-threaded build re-enables the GIL when an extension module does not declare
+        # support for running without it, so report what is actually in effect
+        logger.info("Recognition thread starting (GIL %s)", "enabled" if gil_enabled() else "disabled")
+        self._thread = threading.Thread(target=self._run, name="recognition", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            frame = self.grabber.get(timeout=0.5)
+            if frame is None:
+                continue
+            try:
+                result = self.controller.process_frame(frame, threshold=self.threshold)
+            except Exception as exc:
+                logger.error("Processing failed: %s", exc)
+                continue
+            if result.get("triggered") and self.trigger_pause_sec > 0:
+                # Give the person time to move away, then drop frames to prevent repeated openings
+                self._stop.wait(self.trigger_pause_sec)
+                logger.debug("Door triggered - dropping queued frame to prevent repeated openings")
+                self.grabber.clear()
@@ -0,0 +1,257 @@
+import functools
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from model_registry import cosine_similarity_batch
+
+try:
+    import faiss
+except ImportError:  # without faiss the gallery is scanned with one numpy GEMV
+    faiss = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    # C scan built by build_gallery_kernel.py
+    from _gallery_kernel import ffi as _kernel_ffi, lib as _kernel_lib
+except ImportError:
+    _kernel_lib = None
+
+logger = logging.getLogger(__name__)
+
+# From this many references on, an HNSW graph replaces the exhaustive scan
+HNSW_MIN_SIZE = 10000
+# Rows widened to float32 at a time when a float16/int8 gallery is scored without a compiled kernel
+FLOAT16_BLOCK_ROWS = 256
+
+if numba is not None:
+
+    @numba.njit(cache=True, fastmath=True)
+    def _best_row(matrix, query):
+        """Index and value of max(matrix @ query) in one pass, without a scores array."""
+        best_idx = -1
+        best_score = -np.inf
+        for i in range(matrix.shape[0]):
+            score = np.float32(0.0)
+            for j in range(matrix.shape[1]):
+                score += matrix[i, j] * query[j]
+            if score > best_score:
+                best_idx = i
+                best_score = score
+        return best_idx, best_score
+
+    @numba.njit(cache=True)
+    def _best_row_int8(matrix, row_factor, query):
+        """_best_row() for int8 rows: exact int32 dot products, scaled back per row."""
+        best_idx = -1
+        best_score = -np.inf
+        for i in range(matrix.shape[0]):
+            acc = np.int32(0)
+            for j in range(matrix.shape[1]):
+                acc += np.int32(matrix[i, j]) * np.int32(query[j])
+            score = acc * row_factor[i]
+            if score > best_score:
+                best_idx = i
+                best_score = score
+        return best_idx, best_score
+
+else:
+    _best_row = None
+    _best_row_int8 = None
+
+
+def _kernel_best_row(matrix: np.ndarray, query: np.ndarray) -> Tuple[int, float]:
+    """Same as _best_row() with the compiled C kernel; both arrays must be C-contiguous float32."""
+    out_idx = _kernel_ffi.new("int *")
+    score = _kernel_lib.best_score(
+        _kernel_ffi.from_buffer("float[]", matrix),
+        matrix.shape[0],
+        matrix.shape[1],
+        _kernel_ffi.from_buffer("float[]", query),
+        out_idx,
+    )
+    return out_idx[0], score
+
+
+@functools.lru_cache(maxsize=None)
+def numpy_blas() -> str:
+    """Name of the BLAS numpy was built against (e.g. openblas), "unknown" if numpy does not say."""
+    try:
+        return str(np.show_config(mode="dicts")["Build Dependencies"]["blas"]["name"])
+    except Exception:  # numpy < 1.26 prints the config instead of returning it
+        return "unknown"
+
+
+# Substrings of BLAS names with tuned (SIMD, blocked) GEMV kernels
+OPTIMIZED_BLAS = ("openblas", "mkl", "accelerate", "blis", "armpl", "atlas", "flexiblas")
+
+
+def optimized_blas() -> bool:
+    """
+    False only when numpy reports a BLAS known not to be tuned (e.g. the reference libblas);
+    a numpy that does not say is assumed to have one, as all its wheels do.
+    """
+    name = numpy_blas().lower()
+    return name == "unknown" or any(known in name for known in OPTIMIZED_BLAS)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization: vectors ~= q / scale.
+
+    Returns:
+        (int8 array of the same shape, float32 scale per vector)
+    """
+    vectors = np.atleast_2d(vectors)
+    scales = 127.0 / (np.max(np.abs(vectors), axis=1) + 1e-9)
+    quantized = np.round(vectors * scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class GalleryIndex:
+    """
+    Nearest-reference search over the L2-normalized gallery matrix.
+
+    With faiss installed the rows go into an IndexFlatL2 (IndexHNSWFlat for big galleries).
+    For unit vectors the squared L2 distance maps back to cosine as cos = 1 - d / 2,
+    so scores and thresholds are the same as with the numpy scan.
+
+    With precision="int8" the gallery is kept as int8 rows with a per-row scale instead
+    (a quarter of the memory, the whole gallery stays in cache) and scored with an int32
+    dot product against the quantized query, in the C kernel or with numba. Without
+    either, rows are widened to float32 block by block like float16.
+
+    With precision="float16" the rows are kept in half precision (half the memory and
+    bandwidth) and widened to float32 inside the C kernel while scoring. numpy has no fast
+    float16 GEMV, so without the kernel rows are converted block by block before the GEMV.
+    """
+
+    def __init__(self, matrix: np.ndarray, entries: List[Dict[str, Any]], precision: str = "float32"):
+        if precision not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported gallery precision: {precision}")
+        self.entries = entries
+        self.dim = matrix.shape[1] if entries else 0
+        self.precision = precision
+        self.index = None
+        self.matrix = matrix
+        # Scalar numba loop instead of the GEMV: only worth it without a tuned BLAS
+        self._numba_scan = False
+        if precision == "int8":
+            self.matrix, self.scales = quantize_int8(matrix) if entries else (matrix, None)
+            if entries:
+                # Multiplier back to float per row, so the scan does not divide
+                self.row_factor = np.ascontiguousarray(1.0 / self.scales, dtype=np.float32)
+                if _kernel_lib is None and _best_row_int8 is None:
+                    logger.warning("int8 gallery without _gallery_kernel or numba is slower than float32, run build_gallery_kernel.py")
+                elif _kernel_lib is None:
+                    _best_row_int8(self.matrix[:1], self.row_factor[:1], np.zeros(self.dim, dtype=np.int8))
+        elif precision == "float16":
+            self.matrix = np.ascontiguousarray(matrix, dtype=np.float16)
+            if _kernel_lib is None and entries:
+                logger.warning("float16 gallery without _gallery_kernel is slower than float32, run build_gallery_kernel.py")
+        elif faiss is None and _kernel_lib is not None and entries:
+            self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        elif faiss is None and _best_row is not None and entries and not optimized_blas():
+            self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+            self._numba_scan = True
+            logger.info("numpy BLAS (%s) is not optimized, gallery scanned with numba", numpy_blas())
+            # Compile (or load from the numba cache) now rather than on the first frame
+            _best_row(self.matrix[:1], np.zeros(self.dim, dtype=np.float32))
+        elif faiss is None and entries:
+            # The scan is a single numpy GEMV; its speed is the BLAS numpy was built with
+            logger.info("Gallery scanned with numpy (BLAS: %s)", numpy_blas())
+        elif faiss is not None and entries:
+            dim = matrix.shape[1]
+            if len(entries) >= HNSW_MIN_SIZE:
+                self.index = faiss.IndexHNSWFlat(dim, 32)
+            else:
+                self.index = faiss.IndexFlatL2(dim)
+            self.index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+            logger.debug("Gallery index built: %s (%s references)", type(self.index).__name__, len(entries))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def search(self, embedding: np.ndarray) -> Tuple[Optional[Dict[str, Any]], float]:
+        """Return the closest reference entry and its cosine score, (None, 0.0) if nothing matches."""
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if not self.entries or self.dim != query.shape[0]:
+            return None, 0.0
+        if self.precision == "int8":
+            idx, best_score = self._search_int8(query / (np.linalg.norm(query) + 1e-9))
+        elif self.precision == "float16":
+            idx, best_score = self._search_float16(query / (np.linalg.norm(query) + 1e-9))
+        elif self.index is not None:
+            query = query / (np.linalg.norm(query) + 1e-9)
+            distances, ids = self.index.search(query[None, :], 1)
+            idx = int(ids[0, 0])
+            if idx < 0:
+                return None, 0.0
+            best_score = 1.0 - float(distances[0, 0]) / 2.0
+        elif _kernel_lib is not None:
+            idx, best_score = _kernel_best_row(self.matrix, query / (np.linalg.norm(query) + 1e-9))
+        elif self._numba_scan:
+            idx, best_score = _best_row(self.matrix, query / (np.linalg.norm(query) + 1e-9))
+            best_score = float(best_score)
+        else:
+            # Cosine similarity against every reference at once
+            scores = cosine_similarity_batch(self.matrix, query)
+            idx = int(scores.argmax())
+            best_score = float(scores[idx])
+        if best_score <= 0.0:
+            return None, 0.0
+        return self.entries[idx], best_score
+
+    def _search_int8(self, query: np.ndarray) -> Tuple[int, float]:
+        query_q, query_scale = quantize_int8(query)
+        query_q = np.ascontiguousarray(query_q[0])
+        if _kernel_lib is not None:
+            out_idx = _kernel_ffi.new("int *")
+            score = _kernel_lib.best_score_i8(
+                _kernel_ffi.from_buffer("int8_t[]", self.matrix),
+                _kernel_ffi.from_buffer("float[]", self.row_factor),
+                self.matrix.shape[0],
+                self.matrix.shape[1],
+                _kernel_ffi.from_buffer("int8_t[]", query_q),
+                out_idx,
+            )
+            idx = out_idx[0]
+        elif _best_row_int8 is not None:
+            idx, score = _best_row_int8(self.matrix, self.row_factor, query_q)
+        else:
+            scores = self._block_scores(query_q.astype(np.float32))
+            scores *= self.row_factor
+            idx = int(scores.argmax())
+            score = scores[idx]
+        # The query scale is the same for every row, so it is undone only for the winner
+        return idx, float(score) / float(query_scale[0])
+
+    def _block_scores(self, query: np.ndarray) -> np.ndarray:
+        """self.matrix @ query with rows widened to float32 one block at a time (BLAS GEMV per block)."""
+        block = np.empty((min(FLOAT16_BLOCK_ROWS, len(self.entries)), self.dim), dtype=np.float32)
+        scores = np.empty(len(self.entries), dtype=np.float32)
+        for start in range(0, len(self.entries), block.shape[0]):
+            rows = self.matrix[start:start + block.shape[0]]
+            np.copyto(block[:len(rows)], rows)
+            np.dot(block[:len(rows)], query, out=scores[start:start + len(rows)])
+        return scores
+
+    def _search_float16(self, query: np.ndarray) -> Tuple[int, float]:
+        if _kernel_lib is not None:
+            out_idx = _kernel_ffi.new("int *")
+            score = _kernel_lib.best_score_f16(
+                _kernel_ffi.from_buffer("uint16_t[]", self.matrix),
+                self.matrix.shape[0],
+                self.matrix.shape[1],
+                _kernel_ffi.from_buffer("float[]", query),
+                out_idx,
+            )
+            return out_idx[0], score
+        scores = self._block_scores(query)
+        idx = int(scores.argmax())
+        return idx, float(scores[idx])
@@ -0,0 +1,179 @@
+/*
+ * Fused gallery scan: best (max) dot product of an (n, dim) row-major float32 (or float16)
+ * matrix with a float32 query, or of an int8 matrix with an int8 query, in one pass over
+ * the matrix and without a scores array.
+ * Built into the _gallery_kernel module by build_gallery_kernel.py.
+ */
+#include <float.h>
+#include <stdint.h>
+#include <string.h>
+
+#if defined(__ARM_NEON) || defined(__ARM_NEON__)
+#include <arm_neon.h>
+#elif defined(__F16C__) && defined(__FMA__)
+#include <immintrin.h>
+#endif
+
+static float dot(const float *a, const float *b, int dim)
+{
+    int j = 0;
+#if defined(__ARM_NEON) || defined(__ARM_NEON__)
+    /* Four independent accumulators hide the FMA latency */
+    float32x4_t acc0 = vdupq_n_f32(0.0f), acc1 = acc0, acc2 = acc0, acc3 = acc0;
+    for (; j + 16 <= dim; j += 16) {
+        acc0 = vfmaq_f32(acc0, vld1q_f32(a + j), vld1q_f32(b + j));
+        acc1 = vfmaq_f32(acc1, vld1q_f32(a + j + 4), vld1q_f32(b + j + 4));
+        acc2 = vfmaq_f32(acc2, vld1q_f32(a + j + 8), vld1q_f32(b + j + 8));
+        acc3 = vfmaq_f32(acc3, vld1q_f32(a + j + 12), vld1q_f32(b + j + 12));
+    }
+    float sum = vaddvq_f32(vaddq_f32(vaddq_f32(acc0, acc1), vaddq_f32(acc2, acc3)));
+#else
+    /* Same 4-way split; -O3 -ffast-math lets the compiler vectorize it (SSE/AVX) */
+    float acc0 = 0.0f, acc1 = 0.0f, acc2 = 0.0f, acc3 = 0.0f;
+    for (; j + 4 <= dim; j += 4) {
+        acc0 += a[j] * b[j];
+        acc1 += a[j + 1] * b[j + 1];
+        acc2 += a[j + 2] * b[j + 2];
+        acc3 += a[j + 3] * b[j + 3];
+    }
+    float sum = (acc0 + acc1) + (acc2 + acc3);
+#endif
+    for (; j < dim; j++)
+        sum += a[j] * b[j];
+    return sum;
+}
+
+#if !(defined(__ARM_NEON) || defined(__ARM_NEON__)) && !(defined(__F16C__) && defined(__FMA__))
+/* IEEE half -> float for targets without a hardware conversion */
+static float half_to_float(uint16_t h)
+{
+    uint32_t sign = (uint32_t)(h & 0x8000) << 16;
+    uint32_t exp = (h >> 10) & 0x1f;
+    uint32_t mant = h & 0x3ff;
+    uint32_t bits;
+    if (exp == 0x1f) {
+        bits = sign | 0x7f800000 | (mant << 13);
+    } else if (exp != 0) {
+        bits = sign | ((exp + 112) << 23) | (mant << 13);
+    } else if (mant == 0) {
+        bits = sign;
+    } else {
+        /* Subnormal half: normalize the mantissa */
+        exp = 113;
+        while (!(mant & 0x400)) {
+            mant <<= 1;
+            exp--;
+        }
+        bits = sign | (exp << 23) | ((mant & 0x3ff) << 13);
+    }
+    float f;
+    memcpy(&f, &bits, sizeof(f));
+    return f;
+}
+#endif
+
+/* Dot product of a float16 row with a float32 query; rows are widened on the fly */
+static float dot_f16(const uint16_t *a, const float *b, int dim)
+{
+    int j = 0;
+    float sum;
+#if defined(__ARM_NEON) || defined(__ARM_NEON__)
+    float32x4_t acc0 = vdupq_n_f32(0.0f), acc1 = acc0;
+    for (; j + 8 <= dim; j += 8) {
+        acc0 = vfmaq_f32(acc0, vcvt_f32_f16(vld1_f16((const __fp16 *)(a + j))), vld1q_f32(b + j));
+        acc1 = vfmaq_f32(acc1, vcvt_f32_f16(vld1_f16((const __fp16 *)(a + j + 4))), vld1q_f32(b + j + 4));
+    }
+    sum = vaddvq_f32(vaddq_f32(acc0, acc1));
+    for (; j < dim; j++)
+        sum += (float)((const __fp16 *)a)[j] * b[j];
+#elif defined(__F16C__) && defined(__FMA__)
+    __m256 acc = _mm256_setzero_ps();
+    for (; j + 8 <= dim; j += 8)
+        acc = _mm256_fmadd_ps(_mm256_cvtph_ps(_mm_loadu_si128((const __m128i *)(a + j))), _mm256_loadu_ps(b + j), acc);
+    float lanes[8];
+    _mm256_storeu_ps(lanes, acc);
+    sum = ((lanes[0] + lanes[1]) + (lanes[2] + lanes[3])) + ((lanes[4] + lanes[5]) + (lanes[6] + lanes[7]));
+    for (; j < dim; j++)
+        sum += _cvtsh_ss(a[j]) * b[j];
+#else
+    sum = 0.0f;
+    for (; j < dim; j++)
+        sum += half_to_float(a[j]) * b[j];
+#endif
+    return sum;
+}
+
+/* int8 dot product with exact int32 accumulation (|a * b| <= 127 * 128 fits int16) */
+static int32_t dot_i8(const int8_t *a, const int8_t *b, int dim)
+{
+    int j = 0;
+    int32_t sum = 0;
+#if defined(__ARM_FEATURE_DOTPROD)
+    /* SDOT (Pi 5 / ARMv8.2): 16 multiply-adds per instruction */
+    int32x4_t acc0 = vdupq_n_s32(0), acc1 = acc0;
+    for (; j + 32 <= dim; j += 32) {
+        acc0 = vdotq_s32(acc0, vld1q_s8(a + j), vld1q_s8(b + j));
+        acc1 = vdotq_s32(acc1, vld1q_s8(a + j + 16), vld1q_s8(b + j + 16));
+    }
+    sum = vaddvq_s32(vaddq_s32(acc0, acc1));
+#elif defined(__ARM_NEON) || defined(__ARM_NEON__)
+    /* Pi 4: widening multiply to int16, pairwise accumulate into int32 */
+    int32x4_t acc = vdupq_n_s32(0);
+    for (; j + 16 <= dim; j += 16) {
+        int8x16_t va = vld1q_s8(a + j), vb = vld1q_s8(b + j);
+        acc = vpadalq_s16(acc, vmull_s8(vget_low_s8(va), vget_low_s8(vb)));
+        acc = vpadalq_s16(acc, vmull_high_s8(va, vb));
+    }
+    sum = vaddvq_s32(acc);
+#endif
+    /* Elsewhere -O3 -march=native vectorizes this loop (e.g. pmaddwd / vpdpbusd) */
+    for (; j < dim; j++)
+        sum += (int32_t)a[j] * b[j];
+    return sum;
+}
+
+float best_score(const float *matrix, int n, int dim, const float *query, int *out_idx)
+{
+    float best = -FLT_MAX;
+    int best_idx = -1;
+    for (int i = 0; i < n; i++) {
+        float score = dot(matrix + (long)i * dim, query, dim);
+        if (score > best) {
+            best = score;
+            best_idx = i;
+        }
+    }
+    *out_idx = best_idx;
+    return best;
+}
+
+float best_score_f16(const uint16_t *matrix, int n, int dim, const float *query, int *out_idx)
+{
+    float best = -FLT_MAX;
+    int best_idx = -1;
+    for (int i = 0; i < n; i++) {
+        float score = dot_f16(matrix + (long)i * dim, query, dim);
+        if (score > best) {
+            best = score;
+            best_idx = i;
+        }
+    }
+    *out_idx = best_idx;
+    return best;
+}
+
+/* Rows are int8 with a per-row factor back to float (1 / quantization scale) */
+float best_score_i8(const int8_t *matrix, const float *row_factor, int n, int dim, const int8_t *query, int *out_idx)
+{
+    float best = -FLT_MAX;
+    int best_idx = -1;
+    for (int i = 0; i < n; i++) {
+        float score = (float)dot_i8(matrix + (long)i * dim, query, dim) * row_factor[i];
+        if (score > best) {
+            best = score;
+            best_idx = i;
+        }
+    }
+    *out_idx = best_idx;
+    return best;
+}
@@ -1,5 +1,7 @@
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 logger = logging.getLogger(__name__)
@@ -7,8 +9,7 @@ logger = logging.getLogger(__name__)
 
 class GPIOController:
     """
-    Minimal GPIO driver using libgpiod.
-    Prefers gpiod v2 API (request_lines); falls back to v1 (Chip/get_line).
+    Minimal GPIO driver using libgpiod v2 API (request_lines).
     If gpiod is missing/unavailable, actions are only logged.
 
     Logic: GPIO17 is HIGH by default (door locked),
@@ -21,8 +22,18 @@ class GPIOController:
         self.chip_name = chip
         self.consumer = consumer
         self.mode: str = "none"
-        self.line = None
         self.line_request = None
+        # Bound once in _init_gpio so trigger() does no imports/attribute lookups
+        self._set_value = None
+        self._value_high = None
+        self._value_low = None
+        # The pulse runs in one worker thread so trigger() returns immediately;
+        # triggers arriving while a pulse is in flight are coalesced into it
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpio-pulse")
+        self._pulse_lock = threading.Lock()
+        self._pulse_until = 0.0
+        # Set by cleanup(); later triggers (e.g. the exit button during shutdown) are dropped
+        self._closed = False
         self._init_gpio()
 
     def _init_gpio(self) -> None:
@@ -62,10 +73,13 @@ class GPIOController:
                 )
                 self.line_request = request
                 self.mode = "v2"
+                self._set_value = request.set_value
+                self._value_high = gpiod.line.Value.ACTIVE
+                self._value_low = gpiod.line.Value.INACTIVE
 
                 # Set initial state to HIGH (door locked)
                 try:
-                    self.line_request.set_value(self.pin, gpiod.line.Value.ACTIVE)
+                    self._set_value(self.pin, self._value_high)
                 except Exception as exc:
                     logger.warning("Failed to set initial HIGH state (v2): %s", exc)
 
@@ -89,27 +103,31 @@ class GPIOController:
         """
         Trigger door unlock: set GPIO to LOW (door unlocked),
         wait for pulse_ms, then set back to HIGH (door locked).
+
+        Non-blocking: the pulse runs in a background thread. A trigger while the door
+        is already held open is ignored.
         """
+        now = time.monotonic()
+        with self._pulse_lock:
+            if self._closed:
+                logger.info("GPIO trigger ignored: controller is shut down")
+                return
+            if now < self._pulse_until:
+                return
+            self._pulse_until = now + self.pulse_ms / 1000
+            # Under the lock, so cleanup() cannot shut the pool down between check and submit
+            self._pool.submit(self._pulse)
+
+    def _pulse(self) -> None:
         if self.mode == "v2" and self.line_request:
             try:
-                import gpiod  # type: ignore
-
                 # Set to LOW (door unlocked)
-                self.line_request.set_value(self.pin, gpiod.line.Value.INACTIVE)
+                self._set_value(self.pin, self._value_low)
                 time.sleep(self.pulse_ms / 1000)
                 # Set back to HIGH (door locked)
-                self.line_request.set_value(self.pin, gpiod.line.Value.ACTIVE)
+                self._set_value(self.pin, self._value_high)
             except Exception as exc:
                 logger.error("GPIO trigger failed (v2): %s", exc)
-        elif self.mode == "v1" and self.line:
-            try:
-                # Set to LOW (door unlocked)
-                self.line.set_value(0)
-                time.sleep(self.pulse_ms / 1000)
-                # Set back to HIGH (door locked)
-                self.line.set_value(1)
-            except Exception as exc:
-                logger.error("GPIO trigger failed (v1): %s", exc)
         else:
             logger.info("GPIO trigger simulated: LOW for %sms on pin %s, then back to HIGH", self.pulse_ms, self.pin)
 
@@ -117,12 +135,15 @@ class GPIOController:
         """
         Cleanup GPIO resources. Ensures pin is set to HIGH (door locked) before releasing.
         """
+        with self._pulse_lock:
+            self._closed = True
+        # Let a pulse in flight finish so it cannot set the line after release
+        self._pool.shutdown(wait=True)
         try:
             if self.mode == "v2" and self.line_request:
                 try:
-                    import gpiod  # type: ignore
                     # Ensure door is locked before cleanup
-                    self.line_request.set_value(self.pin, gpiod.line.Value.ACTIVE)
+                    self._set_value(self.pin, self._value_high)
                 except Exception:
                     pass
                 try:
@@ -133,12 +154,5 @@ class GPIOController:
                         self.line_request.close()
                     except Exception:
                         pass
-            if self.mode == "v1" and self.line:
-                try:
-                    # Ensure door is locked before cleanup
-                    self.line.set_value(1)
-                except Exception:
-                    pass
-                self.line.release()
         except Exception as exc:
             logger.warning("GPIO cleanup failed: %s", exc)
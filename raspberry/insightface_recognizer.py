@@ -1,15 +1,45 @@
 import io
 import logging
-from typing import Optional
+import time
+from typing import List, Optional, Tuple, Union
 
 import cv2
 import numpy as np
 from insightface.app import FaceAnalysis
+from insightface.utils import face_align
 
-from model_registry import BaseRecognizer
+from jpeg_codec import JpegDecoder
+from model_registry import BaseRecognizer, onnx_provider_options, onnx_providers
 
 logger = logging.getLogger(__name__)
 
+# Average-hash Hamming distance below which two face crops count as the same face
+SAME_FACE_MAX_BITS = 6
+# ... and the face box must overlap the previous one at least this much (intersection over union)
+SAME_FACE_MIN_IOU = 0.8
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    """Intersection over union of two (x1, y1, x2, y2, ...) boxes."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    inter = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+def _average_hash(img: np.ndarray, bbox: np.ndarray) -> int:
+    """64-bit average hash of the face box: 8x8 grayscale thumbnail thresholded at its mean."""
+    height, width = img.shape[:2]
+    x1, y1, x2, y2 = bbox[:4].astype(int)
+    crop = img[max(y1, 0):min(y2, height), max(x1, 0):min(x2, width)]
+    if crop.size == 0:
+        return -1
+    thumb = cv2.resize(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), (8, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(thumb > thumb.mean()).tobytes(), "big")
+
 
 class InsightFaceRecognizer(BaseRecognizer):
     """
@@ -24,32 +54,73 @@ class InsightFaceRecognizer(BaseRecognizer):
 
     name = "insightface"
 
-    def __init__(self, model_name: str = "buffalo_l", det_size: tuple = (320, 320)):
+    def __init__(
+        self,
+        model_name: str = "buffalo_l",
+        det_size: tuple = (320, 320),
+        providers: Optional[List[str]] = None,
+        same_face_window_sec: float = 0.0,
+    ):
         """
         Initialize InsightFace recognizer.
 
         Args:
             model_name: Model name to use (default: buffalo_l)
             det_size: Detection size for face detection (default: (320, 320) - optimized for RPi)
+            providers: ONNX Runtime providers (default: XNNPACK if available, then CPU)
+            same_face_window_sec: embed_live() reuses the previous embedding when the face crop
+                looks the same (average hash) in the same place (box IoU) within this many
+                seconds; 0 disables it. A look-alike stepping into the same spot within the
+                window would get the previous person's identity, so keep it short
         """
         self.model_name = model_name
         self.det_size = det_size
+        self.same_face_window_sec = same_face_window_sec
+        # (face hash, face box, monotonic time, embedding) of the last live frame
+        self._last_live: Optional[Tuple[int, np.ndarray, float, np.ndarray]] = None
+        # Frames are scaled down to this longer side before detection: twice the detector
+        # input still leaves enough pixels around a face for the 112x112 recognition crop
+        self.max_side = 2 * max(det_size)
+        self._decoder = JpegDecoder()
 
         # Initialize FaceAnalysis app with only necessary modules (detection + recognition)
         # This reduces memory usage significantly - no genderage, age, etc.
+        self.providers = providers or onnx_providers()
         self.app = FaceAnalysis(
             name=model_name,
-            providers=['CPUExecutionProvider'],
+            providers=self.providers,
+            provider_options=onnx_provider_options(self.providers),
             allowed_modules=['detection', 'recognition']  # Only load what we need!
         )
         self.app.prepare(ctx_id=-1, det_size=det_size)
+        # (1, 512) for the buffalo models; a symbolic size leaves it to the gallery to infer
+        output_shape = getattr(self.app.models.get("recognition"), "output_shape", None)
+        if output_shape and isinstance(output_shape[-1], int):
+            self.embedding_dim = output_shape[-1]
 
         logger.info(
-            "InsightFaceRecognizer loaded model %s with det_size=%s (memory optimized for RPi)",
+            "InsightFaceRecognizer loaded model %s with det_size=%s, providers=%s (memory optimized for RPi)",
             model_name,
             det_size,
+            self.providers,
         )
 
+    def _decode(self, image_bytes: bytes, min_side: int = 0) -> Optional[np.ndarray]:
+        """
+        Args:
+            min_side: Decode big images straight at 1/2, 1/4 or 1/8 scale while the shorter side
+                stays >= min_side (0 = full size, for photos whose face crop must stay sharp)
+        """
+        return self._decoder.decode(image_bytes, min_side=min_side)
+
+    def _fit(self, img: np.ndarray) -> np.ndarray:
+        """Scaled-down copy for the detector (keeping aspect ratio) with the longer side at most max_side."""
+        longest = max(img.shape[:2])
+        if longest <= self.max_side:
+            return img
+        scale = self.max_side / longest
+        return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
     def has_face(self, image_bytes: bytes) -> bool:
         """
         Check if image contains a face without extracting embedding.
@@ -61,17 +132,21 @@ class InsightFaceRecognizer(BaseRecognizer):
             True if at least one face is detected, False otherwise
         """
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            if img is None:
-                return False
-
-            # Detect faces
-            faces = self.app.get(img)
+            # Detection only: the detector input size is all the resolution needed
+            img = self._decode(image_bytes, min_side=min(self.det_size))
+        except Exception as exc:
+            logger.debug("Face detection failed: %s", exc)
+            return False
+        if img is None:
+            return False
+        return self.has_face_frame(img)
 
-            return len(faces) > 0
+    def has_face_frame(self, img: np.ndarray) -> bool:
+        """Same as has_face() for an already decoded BGR frame."""
+        try:
+            # Detector only: FaceAnalysis.get() would also run recognition on every face found
+            bboxes, _ = self.app.det_model.detect(self._fit(img), max_num=1, metric="default")
+            return bboxes.shape[0] > 0
         except Exception as exc:
             logger.debug("Face detection failed: %s", exc)
             return False
@@ -89,23 +164,150 @@ class InsightFaceRecognizer(BaseRecognizer):
         Raises:
             ValueError: If no face is detected in the image
         """
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = self._decode(image_bytes)
+
+        if img is None:
+            raise ValueError("Failed to decode image")
+
+        return self.embed_frame(img)
+
+    def embed_frame(self, img: np.ndarray) -> np.ndarray:
+        """
+        Extract face embedding from an already decoded BGR frame, skipping the JPEG
+        encode/decode round-trip when the camera hands out decoded frames.
+
+        Args:
+            img: BGR image (H, W, 3) uint8
+
+        Returns:
+            Face embedding as numpy array (512-dimensional vector)
+
+        Raises:
+            ValueError: If no face is detected in the image
+        """
+        bbox, kps = self._detect_first(img)
+        return self._embed_crops([self._align(img, kps)])[0]
 
+    def embed_live(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Same as embed() for a camera frame, with a shortcut for the common case of the same
+        person still standing in front of the camera: if the detected face crop hashes (almost)
+        the same and sits in the same place as on the previous live frame within
+        same_face_window_sec, the previous embedding is returned and the recognition network
+        is not run.
+        """
+        img = self._decode(image_bytes, min_side=self.max_side)
         if img is None:
             raise ValueError("Failed to decode image")
+        return self.embed_live_frame(img)
 
-        # Detect faces and extract embeddings
-        faces = self.app.get(img)
+    def embed_live_frame(self, img: np.ndarray) -> np.ndarray:
+        """embed_live() for an already decoded BGR frame."""
+        if self.same_face_window_sec <= 0:
+            return self.embed_frame(img)
+        bbox, kps = self._detect_first(img)
+        return self._embed_live_detected(img, bbox, kps)
 
-        if len(faces) == 0:
+    def detect_and_embed(self, frame: Union[bytes, np.ndarray]) -> Optional[np.ndarray]:
+        """
+        has_face() followed by embed_live() with a single detector pass.
+
+        Args:
+            frame: JPEG bytes or BGR frame
+
+        Returns:
+            Normalized embedding of the best-scoring face, None if no face was found
+        """
+        try:
+            # Live JPEGs may be decoded reduced, but not below what the aligned crop needs
+            img = frame if isinstance(frame, np.ndarray) else self._decode(frame, min_side=self.max_side)
+            if img is None:
+                return None
+            bbox, kps = self._detect_first(img)
+        except Exception as exc:
+            logger.debug("Face detection failed: %s", exc)
+            return None
+        if self.same_face_window_sec <= 0:
+            return self._embed_crops([self._align(img, kps)])[0]
+        return self._embed_live_detected(img, bbox, kps)
+
+    def _embed_live_detected(self, img: np.ndarray, bbox: np.ndarray, kps: np.ndarray) -> np.ndarray:
+        """Embedding of a detected live face, reusing the previous one for the same face (see embed_live())."""
+        fingerprint = _average_hash(img, bbox)
+        now = time.monotonic()
+        last = self._last_live
+        if (
+            last is not None
+            and fingerprint >= 0
+            and now - last[2] < self.same_face_window_sec
+            and (fingerprint ^ last[0]).bit_count() < SAME_FACE_MAX_BITS
+            # A different person is unlikely to stand exactly where the previous face was
+            and _iou(bbox, last[1]) >= SAME_FACE_MIN_IOU
+        ):
+            return last[3]
+
+        embedding = self._embed_crops([self._align(img, kps)])[0]
+        self._last_live = (fingerprint, bbox, now, embedding)
+        return embedding
+
+    def _detect_first(self, img: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bounding box and landmarks of the best-scoring face (same detection call FaceAnalysis.get()
+        makes). The detector runs on the scaled-down copy from _fit(); the results are mapped
+        back to img's coordinates, so alignment crops the full-resolution image.
+        """
+        small = self._fit(img)
+        bboxes, kpss = self.app.det_model.detect(small, max_num=0, metric="default")
+        if bboxes.shape[0] == 0 or kpss is None:
             raise ValueError("No face detected in image")
+        # Faces come sorted by detection score
+        bbox, kps = bboxes[0], kpss[0]
+        if small is not img:
+            factor = np.array(
+                [img.shape[1] / small.shape[1], img.shape[0] / small.shape[0]], dtype=np.float32
+            )
+            bbox = bbox.copy()
+            bbox[:4] *= np.tile(factor, 2)
+            kps = kps * factor
+        return bbox, kps
 
-        # Use the first detected face
-        face = faces[0]
+    def _align(self, img: np.ndarray, kps: np.ndarray) -> np.ndarray:
+        return face_align.norm_crop(img, landmark=kps, image_size=self.app.models["recognition"].input_size[0])
 
-        # Get the embedding (normed_embedding is already normalized)
-        embedding = face.normed_embedding
+    def _embed_crops(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Run the recognition model once over aligned crops; rows are L2-normalized."""
+        features = self.app.models["recognition"].get_feat(crops).astype(np.float32)
+        features /= np.linalg.norm(features, axis=1, keepdims=True)
+        return features
+
+    def embed_batch(self, images: List[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        Embed several images (e.g. user photos during sync): detection runs per image,
+        then the aligned crops of all images go through the recognition model in one
+        batched forward pass.
+
+        Args:
+            images: Image data as bytes
+
+        Returns:
+            Normalized embedding of the best-scoring face per image, None where no face was found
+        """
+        crops: List[np.ndarray] = []
+        owners: List[int] = []
+        for i, image_bytes in enumerate(images):
+            try:
+                img = self._decode(image_bytes)
+                if img is None:
+                    continue
+                _, kps = self._detect_first(img)
+            except Exception as exc:
+                logger.debug("Face detection failed: %s", exc)
+                continue
+            crops.append(self._align(img, kps))
+            owners.append(i)
 
-        return embedding.astype(np.float32)
+        results: List[Optional[np.ndarray]] = [None] * len(images)
+        if crops:
+            for i, feature in zip(owners, self._embed_crops(crops)):
+                results[i] = feature
+        return results
@@ -0,0 +1,150 @@
+import functools
+import io
+import logging
+import threading
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+try:
+    from turbojpeg import TJPF_BGR, TJSAMP_420, TurboJPEG
+except ImportError:  # PyTurboJPEG is optional, cv2.imdecode is used without it
+    TurboJPEG = None
+
+logger = logging.getLogger(__name__)
+
+# (numerator, denominator) of the scaled IDCT, smallest first
+_SCALES = ((1, 8), (1, 4), (1, 2))
+_CV2_REDUCED = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+# imencode flags matching the TurboJPEG path: baseline, 4:2:0 chroma. The sampling flag
+# only exists since OpenCV 4.5.5; older builds encode 4:2:0 by default anyway
+_CV2_ENCODE_FLAGS = [cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+if hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+    _CV2_ENCODE_FLAGS += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420]
+
+
+@functools.lru_cache(maxsize=None)
+def _load_turbojpeg():
+    """One TurboJPEG instance for the process; it opens a libjpeg-turbo handle per call, so threads can share it."""
+    if TurboJPEG is None:
+        return None
+    try:
+        return TurboJPEG()
+    except (OSError, RuntimeError) as exc:  # libturbojpeg.so not installed
+        logger.warning("PyTurboJPEG installed but libturbojpeg not found, using OpenCV: %s", exc)
+        return None
+
+
+def _pick_scale(width: int, height: int, min_side: int) -> Tuple[int, int]:
+    """Smallest IDCT scale that keeps the shorter side at least min_side pixels."""
+    if min_side > 0:
+        for num, den in _SCALES:
+            if min(width, height) * num // den >= min_side:
+                return num, den
+    return 1, 1
+
+
+def encode_jpeg(img: np.ndarray, quality: int = 95) -> Optional[bytes]:
+    """
+    BGR image -> JPEG bytes (4:2:0, like cv2.imencode's default). Uses libjpeg-turbo's
+    SIMD encoder through PyTurboJPEG when available, cv2.imencode otherwise.
+
+    Returns:
+        JPEG data, None if encoding failed
+    """
+    tj = _load_turbojpeg()
+    if tj is not None:
+        try:
+            return tj.encode(img, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+        except Exception as exc:
+            logger.debug("turbojpeg encode failed, retrying with OpenCV: %s", exc)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality, *_CV2_ENCODE_FLAGS])
+    return buf.tobytes() if ok else None
+
+
+def encode_jpeg_into(img: np.ndarray, out: bytearray, quality: int = 95) -> int:
+    """
+    Like encode_jpeg(), but write the JPEG into a caller-owned buffer. PyTurboJPEG 2.x
+    compresses straight into it (out must then hold libjpeg-turbo's worst-case size);
+    otherwise the encoded bytes are copied in.
+
+    Returns:
+        Number of bytes written to out, 0 if encoding failed or the JPEG does not fit
+    """
+    tj = _load_turbojpeg()
+    if tj is not None:
+        try:
+            _, size = tj.encode(img, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420, dst=out)
+            return size
+        except TypeError:
+            pass  # PyTurboJPEG < 2 has no dst
+        except Exception as exc:
+            logger.debug("turbojpeg encode into buffer failed, encoding to bytes: %s", exc)
+    data = encode_jpeg(img, quality)
+    if data is None or len(data) > len(out):
+        return 0
+    memoryview(out)[: len(data)] = data
+    return len(data)
+
+
+class JpegDecoder:
+    """
+    JPEG -> BGR decoder that decodes at a reduced scale when the caller needs fewer
+    pixels than the image has, and reuses its output buffer between frames of the same size.
+
+    With PyTurboJPEG (and libturbojpeg) the image is decoded by libjpeg-turbo straight into
+    the reused buffer; otherwise cv2.imdecode with IMREAD_REDUCED_COLOR_* is used.
+    Other formats (PNG, BMP) always go through cv2.imdecode.
+
+    The returned array is only valid until the next decode() in the same thread.
+    """
+
+    def __init__(self):
+        self._tj = _load_turbojpeg()
+        # One buffer per thread: recognition and sync decode concurrently
+        self._local = threading.local()
+
+    @property
+    def backend(self) -> str:
+        return "turbojpeg" if self._tj is not None else "opencv"
+
+    def decode(self, data: bytes, min_side: int = 0) -> Optional[np.ndarray]:
+        """
+        Args:
+            data: Encoded image
+            min_side: Decode at 1/2, 1/4 or 1/8 scale as long as the shorter side stays >= min_side
+                (0 = full size)
+
+        Returns:
+            BGR image (H, W, 3) uint8, None if the data could not be decoded
+        """
+        if self._tj is not None:
+            try:
+                width, height, _, _ = self._tj.decode_header(data)
+            except Exception:
+                pass  # not a JPEG
+            else:
+                num, den = _pick_scale(width, height, min_side)
+                # Same rounding as libjpeg-turbo's TJSCALED()
+                shape = ((height * num + den - 1) // den, (width * num + den - 1) // den, 3)
+                buffer = getattr(self._local, "buffer", None)
+                if buffer is None or buffer.shape != shape:
+                    buffer = self._local.buffer = np.empty(shape, dtype=np.uint8)
+                try:
+                    return self._tj.decode(data, pixel_format=TJPF_BGR, scaling_factor=(num, den), dst=buffer)
+                except Exception as exc:
+                    logger.debug("turbojpeg decode failed, retrying with OpenCV: %s", exc)
+
+        flags = cv2.IMREAD_COLOR
+        if min_side > 0:
+            try:
+                # Header only
+                width, height = Image.open(io.BytesIO(data)).size
+            except Exception:
+                pass
+            else:
+                _, den = _pick_scale(width, height, min_side)
+                flags = _CV2_REDUCED.get(den, cv2.IMREAD_COLOR)
+        return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
@@ -1,19 +1,28 @@
 import logging
+import signal
+import threading
 import time
 
 from config import PiSettings
 from pipeline import AccessController
 from rtsp_client import RTSPClient
 from exit_button import ExitButton
+from frame_source import FrameGrabber, RecognitionWorker
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
+SYNC_RETRY_SEC = 10  # Пауза перед повтором неудачной синхронизации
+
 
 def main():
-    settings = PiSettings()
+    settings = PiSettings.load()
     controller = AccessController(settings)
-    rtsp = RTSPClient(settings.rtsp_url)
+    # Кадр сразу уменьшается до размера, с которым работает детектор распознавателя
+    # (InsightFace: max_side), чтобы внутри распознавателя не было второго resize
+    resize_width = min(640, getattr(controller.recognizer, "max_side", 640))
+    # FrameGrabber читает поток непрерывно, буфер не накапливается
+    rtsp = RTSPClient(settings.rtsp_url, resize_width=resize_width, flush_before_read=False)
 
     # Initialize exit button (if enabled)
     exit_button = None
@@ -35,48 +44,37 @@ def main():
     except Exception as exc:
         logger.warning("Initial sync failed, using cache if present: %s", exc)
 
-    last_sync = time.time()
-    frame_counter = 0  # Счетчик кадров для пропуска
-
+    # Кадры читаются и распознаются в фоновых потоках, основной поток занимается синхронизацией
+    grabber = FrameGrabber(rtsp, frame_skip=settings.rtsp_frame_skip)
+    worker = RecognitionWorker(
+        controller,
+        grabber,
+        threshold=settings.rtsp_threshold,  # RTSP threshold вместо обычного
+        trigger_pause_sec=1.0,  # Give extra time for person to move away after opening
+    )
+    grabber.start()
+    worker.start()
+
+    # Основной поток спит до срока следующей синхронизации или до сигнала остановки
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    next_sync = time.monotonic() + settings.sync_interval_sec
     try:
-        while True:
-            now = time.time()
-            if now - last_sync > settings.sync_interval_sec:
-                try:
-                    controller.refresh_from_cloud()
-                    last_sync = now
-                except Exception as exc:
-                    logger.warning("Sync failed: %s", exc)
-
-            # Пропускаем кадры для ускорения RTSP обработки
-            frame_counter += 1
-            if frame_counter >= settings.rtsp_frame_skip:
-                frame_counter = 0
-                try:
-                    # Используем RTSP threshold вместо обычного
-                    original_threshold = controller.settings.threshold
-                    controller.settings.threshold = settings.rtsp_threshold
-
-                    result = controller.run_once(rtsp)
-
-                    # Восстанавливаем оригинальный threshold
-                    controller.settings.threshold = original_threshold
-
-                    # If access was granted and door was triggered, clear buffer to prevent processing old frames
-                    if result.get("triggered"):
-                        logger.debug("Door triggered - clearing RTSP buffer to prevent repeated openings")
-                        rtsp.clear_buffer(num_frames=15)  # Clear more frames for RTSP due to latency
-                        frame_counter = 0  # Reset frame counter
-                        time.sleep(1.0)  # Give extra time for person to move away
-                except Exception as exc:
-                    logger.error("Processing failed: %s", exc)
-
-            time.sleep(0.05)  # Уменьшили с 0.1 до 0.05 для более частого чтения RTSP
-    except KeyboardInterrupt:
+        while not stop.wait(timeout=max(0.0, next_sync - time.monotonic())):
+            try:
+                controller.refresh_from_cloud()
+                next_sync = time.monotonic() + settings.sync_interval_sec
+            except Exception as exc:
+                logger.warning("Sync failed, retrying in %ss: %s", SYNC_RETRY_SEC, exc)
+                next_sync = time.monotonic() + SYNC_RETRY_SEC
         logger.info("Stopping controller")
     finally:
         if exit_button:
             exit_button.stop()
+        worker.stop()
+        grabber.stop()
         rtsp.release()
         controller.gpio.cleanup()
 
@@ -1,19 +1,29 @@
 import logging
+import signal
+import threading
 import time
 
 from config import PiSettings
 from pipeline import AccessController
 from usb_camera_client import USBCameraClient
 from exit_button import ExitButton
+from frame_source import FrameGrabber, RecognitionWorker
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
+SYNC_RETRY_SEC = 10  # Пауза перед повтором неудачной синхронизации
+
 
 def main():
-    settings = PiSettings()
+    settings = PiSettings.load()
     controller = AccessController(settings)
-    camera = USBCameraClient(settings.usb_device_index)
+    camera = USBCameraClient(
+        settings.usb_device_index,
+        width=settings.usb_frame_width,
+        height=settings.usb_frame_height,
+        fps=settings.usb_fps,
+    )
 
     # Initialize exit button (if enabled)
     exit_button = None
@@ -40,26 +50,32 @@ def main():
             logger.error("Initial sync failed, retrying in 5s: %s", exc)
             time.sleep(5)
 
-    last_sync = time.time()
+    # Кадры читаются и распознаются в фоновых потоках, основной поток занимается синхронизацией
+    grabber = FrameGrabber(camera)
+    worker = RecognitionWorker(controller, grabber)
+    grabber.start()
+    worker.start()
+
+    # Основной поток спит до срока следующей синхронизации или до сигнала остановки
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    next_sync = time.monotonic() + settings.sync_interval_sec
     try:
-        while True:
-            now = time.time()
-            if now - last_sync > settings.sync_interval_sec:
-                try:
-                    controller.refresh_from_cloud()
-                    last_sync = now
-                except Exception as exc:
-                    logger.warning("Sync failed, will retry later: %s", exc)
+        while not stop.wait(timeout=max(0.0, next_sync - time.monotonic())):
             try:
-                controller.run_once(camera)
+                controller.refresh_from_cloud()
+                next_sync = time.monotonic() + settings.sync_interval_sec
             except Exception as exc:
-                logger.error("Processing failed: %s", exc)
-            time.sleep(0.1)
-    except KeyboardInterrupt:
+                logger.warning("Sync failed, retrying in %ss: %s", SYNC_RETRY_SEC, exc)
+                next_sync = time.monotonic() + SYNC_RETRY_SEC
         logger.info("Stopping controller")
     finally:
         if exit_button:
             exit_button.stop()
+        worker.stop()
+        grabber.stop()
         camera.release()
         controller.gpio.cleanup()
 
@@ -1,40 +1,166 @@
 import hashlib
 import io
+import logging
+import os
 from abc import ABC, abstractmethod
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Union
 
 import numpy as np
 from PIL import Image
 
+try:
+    import cv2
+
+    from jpeg_codec import encode_jpeg
+except ImportError:  # HashedRecognizer falls back to Pillow
+    cv2 = None
+
+try:
+    import blake3
+except ImportError:  # hashlib's sha256 (OpenSSL, uses the CPU's SHA extensions when present)
+    blake3 = None
+
+logger = logging.getLogger(__name__)
+
+_INV255 = np.float32(1.0 / 255.0)
+
+XNNPACK_PROVIDER = "XnnpackExecutionProvider"
+
+
+def _digest(data: bytes) -> bytes:
+    """32-byte digest: BLAKE3 (SIMD) when available, otherwise SHA-256."""
+    if blake3 is not None:
+        return blake3.blake3(data).digest(length=32)
+    return hashlib.sha256(data).digest()
+
+
+def onnx_providers(preferred: str = "") -> List[str]:
+    """
+    ONNX Runtime execution providers to use, in order.
+
+    Args:
+        preferred: Comma-separated provider names (ONNX_PROVIDERS). Empty means XNNPACK
+            (NEON-tuned kernels, needs onnxruntime built with --use_xnnpack) if the installed
+            onnxruntime has it, then CPU. Providers missing from the build are dropped.
+    """
+    import onnxruntime as ort
+
+    available = ort.get_available_providers()
+    names = [name.strip() for name in preferred.split(",") if name.strip()]
+    names = [name for name in names or [XNNPACK_PROVIDER, "CPUExecutionProvider"] if name in available]
+    if "CPUExecutionProvider" not in names:
+        names.append("CPUExecutionProvider")
+    return names
+
+
+def onnx_provider_options(providers: List[str]) -> List[Dict[str, str]]:
+    """Per-provider options matching onnx_providers(): XNNPACK gets its own thread pool."""
+    return [
+        {"intra_op_num_threads": str(os.cpu_count() or 4)} if name == XNNPACK_PROVIDER else {}
+        for name in providers
+    ]
+
 
 class BaseRecognizer(ABC):
     name: str = "base"
+    # Length of the vectors embed() returns; None if the recognizer cannot tell up front
+    embedding_dim: Optional[int] = None
 
     @abstractmethod
     def embed(self, image_bytes: bytes) -> np.ndarray:
         raise NotImplementedError
 
+    def embed_live(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Embed a live camera frame. Recognizers may reuse work between consecutive frames
+        here; photos (enrollment) always go through embed().
+        """
+        return self.embed(image_bytes)
+
+    def embed_frame(self, img: np.ndarray) -> np.ndarray:
+        """
+        Embed an already decoded BGR frame (e.g. from RTSPClient.read_frame_array()).
+        Recognizers that work on pixels override this; the default encodes to JPEG for embed().
+        """
+        if cv2 is None:
+            raise RuntimeError("OpenCV is required to embed decoded frames")
+        data = encode_jpeg(img)
+        if data is None:
+            raise ValueError("Failed to encode frame")
+        return self.embed(data)
+
+    def embed_live_frame(self, img: np.ndarray) -> np.ndarray:
+        """embed_live() for an already decoded BGR frame."""
+        return self.embed_frame(img)
+
+    def detect_and_embed(self, frame: Union[bytes, np.ndarray]) -> Optional[np.ndarray]:
+        """
+        Embed a live frame (JPEG bytes or BGR array), None when it has no face.
+        The default checks has_face()/has_face_frame() when the recognizer has them, then
+        calls embed_live()/embed_live_frame(); recognizers whose embedding runs its own
+        face detector override this to detect only once.
+        """
+        decoded = isinstance(frame, np.ndarray)
+        check = getattr(self, "has_face_frame" if decoded else "has_face", None)
+        if check is not None and not check(frame):
+            return None
+        return self.embed_live_frame(frame) if decoded else self.embed_live(frame)
+
+    def embed_batch(self, images: List[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        Embed several images, None for those that could not be embedded (no face, bad data).
+        Recognizers that can batch inference override this; the default calls embed() in turn.
+        """
+        results: List[Optional[np.ndarray]] = []
+        for image_bytes in images:
+            try:
+                results.append(self.embed(image_bytes))
+            except Exception as exc:
+                logger.debug("Embedding failed: %s", exc)
+                results.append(None)
+        return results
+
 
 class HashedRecognizer(BaseRecognizer):
     """
     Deterministic, lightweight recognizer. Replace with FaceNet/ONNX model later
     without changing the AccessController pipeline.
+    Vectors depend on the hash in use (BLAKE3 or SHA-256), so they are only comparable
+    between installations that agree on having the blake3 package.
     """
 
     name = "hashed"
+    embedding_dim = 128
+
+    @staticmethod
+    def _vector(normalized: bytes) -> np.ndarray:
+        digest = _digest(normalized)
+        # 32 bytes -> 32 floats in [0, 1], tiled to 128
+        floats = np.frombuffer(digest, dtype=np.uint8).astype(np.float32)
+        floats *= _INV255
+        return np.tile(floats, 128 // floats.shape[0])
+
+    def embed_frame(self, img: np.ndarray) -> np.ndarray:
+        if cv2 is None:
+            return super().embed_frame(img)
+        return self._vector(cv2.resize(img, (64, 64), interpolation=cv2.INTER_AREA).tobytes())
 
     def embed(self, image_bytes: bytes) -> np.ndarray:
         # Normalize image to reduce noise in hash.
         try:
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            resized = img.resize((64, 64))
-            normalized = resized.tobytes()
+            if cv2 is not None:
+                # libjpeg decodes straight at 1/8 scale, the full-size image is never built
+                img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_COLOR_8)
+                if img is None:
+                    raise ValueError("Failed to decode image")
+                normalized = cv2.resize(img, (64, 64), interpolation=cv2.INTER_AREA).tobytes()
+            else:
+                img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+                resized = img.resize((64, 64))
+                normalized = resized.tobytes()
         except Exception:
             normalized = image_bytes
-        digest = hashlib.sha256(normalized).digest()
-        floats = [b / 255 for b in digest]
-        repeated = (floats * ((128 // len(floats)) + 1))[:128]
-        return np.array(repeated, dtype=np.float32)
+        return self._vector(normalized)
 
 
 class RecognizerRegistry:
@@ -63,3 +189,12 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
         return 0.0
     denom = (np.linalg.norm(a) * np.linalg.norm(b)) + 1e-9
     return float(np.dot(a, b) / denom)
+
+
+def cosine_similarity_batch(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of query against every row of an L2-normalized (N, D) float32 matrix
+    in one matrix-vector product. Only the query is normalized here.
+    """
+    q = np.asarray(query, dtype=np.float32).reshape(-1)
+    return matrix @ (q / (np.linalg.norm(q) + 1e-9))
@@ -1,8 +1,12 @@
 import logging
+import os
 import time
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, time as datetime_time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 
@@ -10,11 +14,57 @@ import cache
 import sync_client
 from config import PiSettings
 from gpio_controller import GPIOController
-from model_registry import RecognizerRegistry, HashedRecognizer, cosine_similarity
+from gallery import GalleryIndex
+from model_registry import RecognizerRegistry, HashedRecognizer, onnx_providers
 from rtsp_client import RTSPClient
 
 logger = logging.getLogger(__name__)
 
+# Photos downloaded and embedded together during sync
+EMBED_BATCH_SIZE = 8
+# Supported local user photo formats
+LOCAL_IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".bmp"})
+# Difference-hash Hamming distance below which two frames count as the same scene
+STATIC_SCENE_MAX_BITS = 6
+
+try:
+    import cv2
+except ImportError:  # without OpenCV every frame goes through face detection
+    cv2 = None
+
+
+def _seconds(moment: datetime_time) -> float:
+    """Seconds since midnight of a datetime.time."""
+    return moment.hour * 3600 + moment.minute * 60 + moment.second + moment.microsecond / 1e6
+
+
+def _scene_hash(frame: Union[bytes, np.ndarray]) -> int:
+    """64-bit difference hash of the whole frame (9x8 grayscale, left/right neighbour comparisons); -1 if unavailable."""
+    if cv2 is None:
+        return -1
+    if isinstance(frame, np.ndarray):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    else:
+        # libjpeg decodes only the DC coefficients at 1/8 scale, enough for a 9x8 thumbnail
+        gray = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if gray is None:
+            return -1
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(thumb[:, 1:] > thumb[:, :-1]).tobytes(), "big")
+
+
+@dataclass(frozen=True, slots=True)
+class MatchState:
+    """
+    Everything a frame is matched and checked against, built from one cache payload.
+    Published by a single attribute assignment and read once per frame, so a frame never
+    sees the gallery of one sync with the users or schedule of another.
+    """
+
+    gallery: GalleryIndex
+    users: Dict[Any, Tuple[Dict[str, Any], Optional[datetime]]]
+    schedule: Dict[int, List[List[Tuple[float, float]]]]
+
 
 class AccessController:
     def __init__(self, settings: PiSettings):
@@ -29,6 +79,8 @@ class AccessController:
         self.consecutive_triggers = 0
         self.max_consecutive_triggers = 3  # Maximum consecutive triggers allowed
         self.last_no_face_time = 0.0  # Track when we last saw no face
+        # (scene hash, monotonic time) of the last frame the detector found no face on
+        self._empty_scene: Optional[Tuple[int, float]] = None
 
         # Register InsightFace recognizer
         try:
@@ -38,7 +90,9 @@ class AccessController:
                 "insightface",
                 InsightFaceRecognizer(
                     model_name=settings.insightface_model_name,
-                    det_size=settings.insightface_det_size
+                    det_size=settings.insightface_det_size,
+                    providers=onnx_providers(settings.onnx_providers),
+                    same_face_window_sec=settings.same_face_window_sec,
                 )
             )
         except Exception as exc:
@@ -48,7 +102,7 @@ class AccessController:
         try:
             from facenet_recognizer import FaceNetRecognizer
 
-            self.recognizer_registry.register("facenet", FaceNetRecognizer(settings.facenet_model_path))
+            self.recognizer_registry.register("facenet", FaceNetRecognizer(settings.facenet_model_path, providers=onnx_providers(settings.onnx_providers)))
         except Exception as exc:
             logger.warning("FaceNet not available on Pi: %s", exc)
 
@@ -60,23 +114,58 @@ class AccessController:
         except KeyError:
             logger.warning("Recognizer %s not found, using default", settings.model_name)
             self.recognizer = self.recognizer_registry.get_default()
-        self.gpio = GPIOController(settings.gpio_pin, settings.gpio_pulse_ms, settings.gpio_chip)
         self.cache = cache.load_cache(settings.cache_path)
+        # Server config from the last sync: a 304 on the next sync does not resend it
+        self._apply_config(self.cache.get("config", {}))
+        self.gpio = GPIOController(settings.gpio_pin, settings.gpio_pulse_ms, settings.gpio_chip)
 
         # Load local users (admin photos) for offline access
         self._load_local_users()
+        self._state = self._build_state(self.cache)
 
     def refresh_from_cloud(self) -> None:
-        payload = sync_client.fetch_sync_payload(self.settings)
-        embeddings = self._build_embeddings_from_photos(payload.get("photos", []))
+        """
+        Download the sync payload and publish it. Runs in the main thread while the
+        recognition worker keeps matching frames: the new cache and gallery are built
+        aside and swapped in by plain reference assignment once complete, so a frame is
+        never matched against a half-built gallery.
+        """
+        current_model = getattr(self.recognizer, "name", "unknown")
+        etag = self.cache.get("sync_etag")
+        if any(e.get("model_name") != current_model for e in self.cache.get("embeddings", []) if not e.get("is_local")):
+            # Cached embeddings come from another model: the photos have to be embedded again
+            etag = None
+        payload = sync_client.fetch_sync_payload(self.settings, etag=etag)
+        if payload is None:
+            logger.info("Sync payload unchanged since last sync, keeping cache")
+            # local_users/ is not covered by the ETag: pick up added/removed photos anyway
+            payload = dict(self.cache)
+            if self._load_local_users(payload):
+                state = self._build_state(payload)
+                self.cache = payload
+                self._state = state
+            return
+        photos = payload.get("photos", [])
+        embeddings = self._build_embeddings_from_photos(photos)
+        # Records without a URL are skipped for good, a retry cannot fix them
+        expected = sum(1 for photo in photos if photo.get("url"))
+        if len(embeddings) < expected:
+            # Without the ETag the next sync downloads the payload again and retries the failed photos
+            logger.warning("%s of %s photos have no embedding, retrying on next sync", expected - len(embeddings), expected)
+            payload.pop("sync_etag", None)
+        # Keep the local users embedded earlier: _load_local_users() below drops those whose
+        # photo changed and embeds only new photos instead of the whole local_users/ folder
+        embeddings.extend(e for e in self.cache.get("embeddings", []) if e.get("is_local"))
         payload["embeddings"] = embeddings
-        self.cache = payload
         cache.save_cache(self.settings.cache_path, payload)
-        config = payload.get("config", {})
-        self.settings.threshold = float(config.get("threshold", self.settings.threshold))
-        self.settings.gpio_pin = int(config.get("gpio_pin", self.settings.gpio_pin))
-        self.settings.gpio_pulse_ms = int(config.get("gpio_pulse_ms", self.settings.gpio_pulse_ms))
-        self.settings.sync_interval_sec = int(config.get("sync_interval_sec", self.settings.sync_interval_sec))
+
+        # Reload local users after cloud refresh
+        self._load_local_users(payload)
+        state = self._build_state(payload)
+        self.cache = payload
+        self._state = state
+
+        self._apply_config(payload.get("config", {}))
         logger.info(
             "Cache refreshed: %s photos -> %s embeddings, %s users",
             len(payload.get("photos", [])),
@@ -84,55 +173,87 @@ class AccessController:
             len(payload.get("users", [])),
         )
 
-        # Reload local users after cloud refresh
-        self._load_local_users()
+    def _apply_config(self, config: Dict[str, Any]) -> None:
+        """Apply the device config sent by the server over the local settings."""
+        self.settings.threshold = float(config.get("threshold", self.settings.threshold))
+        self.settings.gpio_pin = int(config.get("gpio_pin", self.settings.gpio_pin))
+        self.settings.gpio_pulse_ms = int(config.get("gpio_pulse_ms", self.settings.gpio_pulse_ms))
+        self.settings.sync_interval_sec = int(config.get("sync_interval_sec", self.settings.sync_interval_sec))
 
-    def _load_local_users(self) -> None:
+    def _load_local_users(self, payload: Optional[Dict[str, Any]] = None) -> bool:
         """
         Load local user photos from local_users/ directory for offline access.
         These users will always be recognized even without internet connection.
+        New local embeddings are appended to the cache journal so they survive a restart.
+
+        Args:
+            payload: Cache payload to add the local users to (self.cache if None)
+
+        Returns:
+            True if local users were added or removed
         """
+        if payload is None:
+            payload = self.cache
         local_dir = Path(self.settings.local_users_dir)
+
+        local_photos: List[Path] = []
+        present: Dict[str, int] = {}
+        if local_dir.exists():
+            # One directory read; DirEntry carries the file type, so only photos get a stat()
+            with os.scandir(local_dir) as entries:
+                for entry in entries:
+                    if os.path.splitext(entry.name)[1].lower() in LOCAL_IMAGE_EXTENSIONS and entry.is_file():
+                        local_photos.append(Path(entry.path))
+                        present[entry.name] = entry.stat().st_mtime_ns
+
+        # Forget journaled local users whose photo was removed/replaced or that came from another model
+        current_model = getattr(self.recognizer, "name", "unknown")
+        cached = payload.get("embeddings", [])
+        payload["embeddings"] = [
+            e for e in cached
+            if not e.get("is_local")
+            or (present.get(e.get("filename")) == e.get("mtime_ns") and e.get("model_name") == current_model)
+        ]
+        removed = len(payload["embeddings"]) < len(cached)
+
         if not local_dir.exists():
             logger.info("Local users directory not found: %s", local_dir)
-            return
-
-        # Supported image formats
-        image_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
-        local_photos = [f for f in local_dir.iterdir() if f.suffix.lower() in image_extensions]
+            return removed
 
         if not local_photos:
             logger.info("No local user photos found in %s", local_dir)
-            return
+            return removed
 
         logger.info("Loading %s local user photos from %s", len(local_photos), local_dir)
 
+        added: List[Dict[str, Any]] = []
+        # Names of local users already in the cache, looked up per photo
+        existing_local = {e.get("person_name") for e in payload.get("embeddings", []) if e.get("is_local")}
         for photo_path in local_photos:
             try:
-                # Read photo file
-                img_bytes = photo_path.read_bytes()
-
-                # Generate embedding
-                vector = self.recognizer.embed(img_bytes)
-
                 # Use filename (without extension) as person name
                 person_name = photo_path.stem
 
-                # Add to cache embeddings (check if not already exists)
-                existing = any(
-                    e.get("person_name") == person_name and e.get("is_local")
-                    for e in self.cache.get("embeddings", [])
-                )
+                # Add to cache embeddings (check if not already exists) - before running the model
+                if person_name not in existing_local:
+                    # Read photo file
+                    img_bytes = photo_path.read_bytes()
+
+                    # Generate embedding
+                    vector = self.recognizer.embed(img_bytes)
 
-                if not existing:
-                    self.cache.setdefault("embeddings", []).append({
+                    entry = {
                         "user_id": None,  # Local users don't have server user_id
                         "person_name": person_name,
-                        "vector": vector.tolist(),
-                        "model_name": getattr(self.recognizer, "name", "unknown"),
+                        "vector": vector,
+                        "model_name": current_model,
                         "filename": photo_path.name,
+                        "mtime_ns": present[photo_path.name],
                         "is_local": True,  # Mark as local user
-                    })
+                    }
+                    payload.setdefault("embeddings", []).append(entry)
+                    existing_local.add(person_name)
+                    added.append(entry)
                     logger.info("✓ Loaded local user: %s from %s", person_name, photo_path.name)
                 else:
                     logger.debug("Local user %s already in cache", person_name)
@@ -140,88 +261,244 @@ class AccessController:
             except Exception as exc:
                 logger.error("Failed to load local photo %s: %s", photo_path, exc)
 
+        if added:
+            try:
+                cache.append_embeddings(self.settings.cache_path, added)
+            except Exception as exc:
+                logger.warning("Failed to persist local users: %s", exc)
+        return removed or bool(added)
+
     def _build_embeddings_from_photos(self, photos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         embeddings: List[Dict[str, Any]] = []
+        model_name = getattr(self.recognizer, "name", "unknown")
+        # Embeddings of photos downloaded last time, re-used when the server reports them unchanged
+        previous = {
+            e["photo_url"]: e
+            for e in self.cache.get("embeddings", [])
+            if not e.get("is_local") and e.get("photo_etag") and e.get("model_name") == model_name
+        }
+        usable = []
         for photo in photos:
+            if photo.get("url"):
+                usable.append(photo)
+            else:
+                # One bad record must not abort the whole sync
+                self._log_photo_failure(photo, "no url")
+        batches = [usable[start:start + EMBED_BATCH_SIZE] for start in range(0, len(usable), EMBED_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=sync_client.DOWNLOAD_WORKERS) as pool:
+
+            def download(chunk: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Future]]:
+                return [
+                    (
+                        photo,
+                        pool.submit(
+                            sync_client.fetch_photo_if_changed,
+                            self.settings,
+                            photo["url"],
+                            previous[photo["url"]]["photo_etag"] if photo["url"] in previous else None,
+                        ),
+                    )
+                    for photo in chunk
+                ]
+
+            pending = download(batches[0]) if batches else []
+            for index in range(len(batches)):
+                # Photos of a batch download in parallel, and the next batch downloads
+                # while this one is embedded in one recognizer call
+                current = pending
+                pending = download(batches[index + 1]) if index + 1 < len(batches) else []
+                self._embed_downloaded(current, model_name, embeddings, previous)
+        return embeddings
+
+    def _embed_downloaded(
+        self,
+        downloads: List[Tuple[Dict[str, Any], Future]],
+        model_name: str,
+        embeddings: List[Dict[str, Any]],
+        previous: Dict[str, Dict[str, Any]],
+    ) -> None:
+        batch: List[Dict[str, Any]] = []
+        images: List[bytes] = []
+        etags: List[Optional[str]] = []
+        for photo, future in downloads:
             try:
-                img_bytes = sync_client.fetch_photo(self.settings, photo["url"])
-                vector = self.recognizer.embed(img_bytes)
-                embeddings.append(
-                    {
-                        "user_id": photo.get("user_id"),
-                        "person_name": photo.get("person_name"),
-                        "vector": vector.tolist(),
-                        "model_name": getattr(self.recognizer, "name", "unknown"),
-                        "filename": photo.get("filename"),
-                    }
-                )
+                data, etag = future.result()
             except Exception as exc:
-                logger.error(
-                    "Failed to build embedding for photo %s (user_id=%s, url=%s): %s",
-                    photo.get("filename"),
-                    photo.get("user_id"),
-                    photo.get("url"),
-                    exc,
-                )
-        return embeddings
+                self._log_photo_failure(photo, exc)
+                continue
+            if data is None:
+                # Not modified: keep the embedding computed from the same photo last time
+                embeddings.append(self._photo_embedding(photo, previous[photo["url"]]["vector"], model_name, etag))
+                continue
+            images.append(data)
+            batch.append(photo)
+            etags.append(etag)
+        if not images:
+            return
+        try:
+            vectors = self.recognizer.embed_batch(images)
+        except Exception as exc:
+            for photo in batch:
+                self._log_photo_failure(photo, exc)
+            return
+        for photo, vector, etag in zip(batch, vectors, etags):
+            if vector is None:
+                self._log_photo_failure(photo, "no face detected")
+                continue
+            embeddings.append(self._photo_embedding(photo, vector, model_name, etag))
+
+    @staticmethod
+    def _photo_embedding(photo: Dict[str, Any], vector: Any, model_name: str, etag: Optional[str]) -> Dict[str, Any]:
+        return {
+            "user_id": photo.get("user_id"),
+            "person_name": photo.get("person_name"),
+            "vector": vector,
+            "model_name": model_name,
+            "filename": photo.get("filename"),
+            "photo_url": photo.get("url"),
+            "photo_etag": etag,
+        }
 
-    def _best_match(self, embedding: np.ndarray) -> Tuple[Optional[Dict[str, Any]], float]:
-        best_score = 0.0
-        best: Optional[Dict[str, Any]] = None
-        expected_dim = int(embedding.shape[0]) if hasattr(embedding, "shape") else len(embedding)
+    @staticmethod
+    def _log_photo_failure(photo: Dict[str, Any], reason: Any) -> None:
+        logger.error(
+            "Failed to build embedding for photo %s (user_id=%s, url=%s): %s",
+            photo.get("filename"),
+            photo.get("user_id"),
+            photo.get("url"),
+            reason,
+        )
+
+    def _build_state(self, payload: Dict[str, Any]) -> MatchState:
+        return MatchState(
+            gallery=self._build_gallery(payload),
+            users=self._build_users(payload),
+            schedule=self._build_schedule(payload),
+        )
+
+    def _build_gallery(self, payload: Dict[str, Any]) -> GalleryIndex:
+        """
+        Stack the cached embeddings of the current model into an L2-normalized (N, D) float32
+        matrix and index it, so matching a frame is a single search.
+        """
         current_model = getattr(self.recognizer, "name", None)
-        for emb in self.cache.get("embeddings", []):
-            if current_model and emb.get("model_name") and emb["model_name"] != current_model:
-                # Skip embeddings produced by a different model (e.g., hashed 128-dim vs FaceNet 512-dim).
+        candidates = [
+            emb for emb in payload.get("embeddings", [])
+            # Skip embeddings produced by a different model (e.g., hashed 128-dim vs FaceNet 512-dim).
+            if not (current_model and emb.get("model_name") and emb["model_name"] != current_model)
+        ]
+        # The size live embeddings will have; for a recognizer that cannot tell, the most
+        # common size in the cache, so a few stale entries cannot exclude the rest
+        dim = getattr(self.recognizer, "embedding_dim", None)
+        if dim is None and candidates:
+            dim = Counter(int(np.size(emb["vector"])) for emb in candidates).most_common(1)[0][0]
+        entries: List[Dict[str, Any]] = []
+        for emb in candidates:
+            size = int(np.size(emb["vector"]))
+            if size != dim:
+                logger.debug("Skipping embedding id=%s due to dim mismatch: %s vs %s", emb.get("id"), size, dim)
                 continue
-            ref = np.array(emb["vector"], dtype=np.float32)
-            if ref.shape[0] != expected_dim:
-                logger.debug(
-                    "Skipping embedding id=%s due to dim mismatch: %s vs %s",
-                    emb.get("id"),
-                    ref.shape[0],
-                    expected_dim,
-                )
+            entries.append(emb)
+        dim = dim or 0
+
+        # Fill one preallocated C-contiguous matrix: each vector (float16 mmap row, list or
+        # array) is converted to float32 straight into its row, without per-row temporaries
+        matrix = np.empty((len(entries), dim), dtype=np.float32)
+        for row, emb in zip(matrix, entries):
+            row[:] = np.asarray(emb["vector"]).reshape(-1)
+        if entries:
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9
+        return GalleryIndex(matrix, entries, precision=self.settings.gallery_precision)
+
+    @staticmethod
+    def _build_users(payload: Dict[str, Any]) -> Dict[Any, Tuple[Dict[str, Any], Optional[datetime]]]:
+        """user id -> (user, parsed expires_at or None), built once per cache change."""
+        users: Dict[Any, Tuple[Dict[str, Any], Optional[datetime]]] = {}
+        for user in payload.get("users", []):
+            expires: Optional[datetime] = None
+            if user.get("expires_at"):
+                try:
+                    expires = datetime.fromisoformat(str(user["expires_at"]))
+                except ValueError:
+                    pass
+            # First entry wins, as with the linear scan this replaces
+            users.setdefault(user["id"], (user, expires))
+        return users
+
+    @staticmethod
+    def _build_schedule(payload: Dict[str, Any]) -> Dict[int, List[List[Tuple[float, float]]]]:
+        """
+        Parse access windows once per cache change: user_id -> 7 weekdays -> [(start, end)]
+        in seconds since midnight. Users with windows only in unparsable form stay in the
+        table with no usable window, so they are denied as before.
+        """
+        schedule: Dict[int, List[List[Tuple[float, float]]]] = {}
+        for window in payload.get("access_windows", []):
+            days = schedule.setdefault(window["user_id"], [[] for _ in range(7)])
+            try:
+                start = datetime_time.fromisoformat(str(window["start_time"]))
+                end = datetime_time.fromisoformat(str(window["end_time"]))
+                days[window["day_of_week"]].append((_seconds(start), _seconds(end)))
+            except Exception:
                 continue
-            score = cosine_similarity(embedding, ref)
-            if score > best_score:
-                best_score = score
-                best = emb
-        return best, best_score
+        return schedule
 
-    def _is_within_schedule(self, user_id: int, now: Optional[datetime] = None) -> bool:
+    @staticmethod
+    def _is_within_schedule(
+        schedule: Dict[int, List[List[Tuple[float, float]]]], user_id: int, now: Optional[datetime] = None
+    ) -> bool:
         now = now or datetime.utcnow()
-        day = now.weekday()
-        current_time = now.time()
-        windows = [w for w in self.cache.get("access_windows", []) if w["user_id"] == user_id]
-        if not windows:
+        days = schedule.get(user_id)
+        if days is None:
             return True
-        for window in windows:
-            if window["day_of_week"] != day:
-                continue
-            try:
-                from datetime import time as _time
+        current = _seconds(now.time())
+        return any(start <= current <= end for start, end in days[now.weekday()])
 
-                start = _time.fromisoformat(str(window["start_time"]))
-                end = _time.fromisoformat(str(window["end_time"]))
-            except Exception:
-                continue
-            if start <= current_time <= end:
-                return True
-        return False
+    def process_frame(self, frame: Union[bytes, np.ndarray], threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Recognize a frame and open the door on a match.
 
-    def process_frame(self, frame_bytes: bytes) -> Dict[str, Any]:
+        Args:
+            frame: JPEG frame, or a decoded BGR frame (RTSPClient.read_frame_array())
+            threshold: Match threshold for this frame (e.g. RTSP threshold), settings.threshold if None
+        """
         import time as _time
         start_time = _time.time()
+        if threshold is None:
+            threshold = self.settings.threshold
 
-        # First check if there's a face in the frame (fast check)
+        # First check if there's a face in the frame
         # This prevents processing empty frames and false positives
         has_face = False
-        if hasattr(self.recognizer, 'has_face'):
-            has_face = self.recognizer.has_face(frame_bytes)
+        embedding: Optional[np.ndarray] = None
+        decoded = isinstance(frame, np.ndarray)
+        scene = -1
+        if self.settings.static_scene_window_sec > 0:
+            scene = _scene_hash(frame)
+        empty = self._empty_scene
+        if (
+            empty is not None
+            and scene >= 0
+            and time.monotonic() - empty[1] < self.settings.static_scene_window_sec
+            and (scene ^ empty[0]).bit_count() < STATIC_SCENE_MAX_BITS
+        ):
+            # Same empty scene the detector saw moments ago: skip it. The window counts from
+            # that detection, so a face entering the scene is picked up within the window
+            has_face = False
         else:
-            # Fallback for recognizers without has_face method
-            has_face = True
+            if self.consecutive_triggers < self.max_consecutive_triggers:
+                # Detection and embedding in one call: the detector runs once per frame
+                embedding = self.recognizer.detect_and_embed(frame)
+                has_face = embedding is not None
+            elif decoded and hasattr(self.recognizer, 'has_face_frame'):
+                # Frames are ignored until the counter resets, only face/no face matters
+                has_face = self.recognizer.has_face_frame(frame)
+            elif not decoded and hasattr(self.recognizer, 'has_face'):
+                has_face = self.recognizer.has_face(frame)
+            else:
+                # Fallback for recognizers without has_face method
+                has_face = True
+            self._empty_scene = None if has_face or scene < 0 else (scene, time.monotonic())
 
         # Reset consecutive triggers if no face detected for more than 2 seconds
         current_time = time.time()
@@ -238,32 +515,31 @@ class AccessController:
             logger.debug("Max consecutive triggers reached (%d), ignoring frame", self.max_consecutive_triggers)
             return {"allowed": False, "score": 0.0, "user_identifier": None, "triggered": False, "max_triggers": True}
 
-        embedding = self.recognizer.embed(frame_bytes)
-        match, score = self._best_match(embedding)
+        # One read: the gallery, users and schedule below all come from the same sync
+        state = self._state
+        match, score = state.gallery.search(embedding)
 
         processing_time = _time.time() - start_time
 
-        allowed = match is not None and score >= self.settings.threshold
+        allowed = match is not None and score >= threshold
         user_identifier = None
 
         if match and allowed:
-            user = None
+            user, expires_at = None, None
             if match.get("user_id") is not None:
-                user = next((u for u in self.cache.get("users", []) if u["id"] == match["user_id"]), None)
+                user, expires_at = state.users.get(match["user_id"], (None, None))
             user_identifier = user["identifier"] if user else match.get("person_name")
 
             # Check expiration only for server users (not local users)
             if not match.get("is_local"):
-                expires_at = user.get("expires_at") if user else None
-                if expires_at:
+                if expires_at is not None:
                     try:
-                        from datetime import datetime as _dt
-                        if _dt.fromisoformat(str(expires_at)) < _dt.utcnow():
+                        if expires_at < datetime.utcnow():
                             allowed = False
-                    except Exception:
+                    except TypeError:  # timezone-aware expires_at
                         pass
                 if allowed and user:
-                    allowed = self._is_within_schedule(match["user_id"])
+                    allowed = self._is_within_schedule(state.schedule, match["user_id"])
 
         # Apply cooldown: only trigger if enough time has passed since last trigger
         if allowed:
@@ -288,7 +564,7 @@ class AccessController:
         else:
             # Логируем только если есть совпадение но скор низкий
             if match:
-                logger.debug("Access denied: score %.3f < threshold %.3f (processed in %.2fs)", score, self.settings.threshold, processing_time)
+                logger.debug("Access denied: score %.3f < threshold %.3f (processed in %.2fs)", score, threshold, processing_time)
 
         status = "success" if allowed else "denied"
         event_payload = {
@@ -307,9 +583,8 @@ class AccessController:
         return {"allowed": allowed, "score": score, "user_identifier": user_identifier, "triggered": allowed}
 
     def run_once(self, rtsp_client: RTSPClient) -> Dict[str, Any]:
-        frame = rtsp_client.read_frame()
-        if not frame:
+        image = rtsp_client.read_frame_array()
+        if image is None:
             logger.warning("No frame received")
             return {"allowed": False, "score": 0.0}
-        _, frame_bytes = frame
-        return self.process_frame(frame_bytes)
+        return self.process_frame(image)
@@ -1,16 +1,27 @@
 import logging
-from typing import Optional, Tuple
+from typing import Optional
 
 import cv2
 import numpy as np
 
+from jpeg_codec import encode_jpeg
+
 logger = logging.getLogger(__name__)
 
 
 class RTSPClient:
-    def __init__(self, url: str, resize_width: int = 640):
+    def __init__(self, url: str, resize_width: int = 640, flush_before_read: bool = True):
+        """
+        Args:
+            url: RTSP stream URL
+            resize_width: Frames are scaled down to this width
+            flush_before_read: grab() one frame before each read to skip a stale buffered frame.
+                Not needed when a FrameGrabber reads continuously and keeps the buffer drained;
+                there the extra grab() only decodes a frame that is thrown away
+        """
         self.url = url
         self.resize_width = resize_width  # Уменьшаем разрешение для ускорения
+        self.flush_before_read = flush_before_read
         self.capture: Optional[cv2.VideoCapture] = None
         self.frame_counter = 0
 
@@ -31,13 +42,29 @@ class RTSPClient:
             raise RuntimeError("Unable to open RTSP stream")
         logger.info("RTSP connected via TCP: %s (resize to %dpx)", self.url, self.resize_width)
 
-    def read_frame(self) -> Optional[Tuple[bool, bytes]]:
+    def read_frame(self) -> Optional[bytes]:
+        """Read a frame encoded as JPEG (for uploads / tools that need bytes); None if no frame was read."""
+        frame = self.read_frame_array()
+        if frame is None:
+            return None
+        return encode_jpeg(frame, quality=95)
+
+    def read_frame_array(self) -> Optional[np.ndarray]:
+        """
+        Read a frame as a BGR ndarray. Recognition takes this directly: the stream is
+        already decoded by FFmpeg, so encoding it to JPEG only for the recognizer to
+        decode it again would cost a JPEG round-trip per frame.
+
+        Returns:
+            BGR frame, None if no frame was read
+        """
         if not self.capture:
             self.connect()
         assert self.capture
 
         # Пропускаем буферизованные кадры для уменьшения задержки
-        self.capture.grab()  # Очистка буфера
+        if self.flush_before_read:
+            self.capture.grab()  # Очистка буфера
 
         # Пытаемся прочитать кадр, пропускаем поврежденные
         max_attempts = 3
@@ -64,12 +91,9 @@ class RTSPClient:
 
         # Улучшение качества для лучшего распознавания
         # Увеличение контраста и резкости
-        frame = cv2.convertScaleAbs(frame, alpha=1.1, beta=10)  # Яркость/контраст
-
-        ret, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        if not ret:
-            return None
-        return True, buf.tobytes()
+        # In place: the frame is a fresh array from read()/resize(), no need for another one
+        cv2.convertScaleAbs(frame, dst=frame, alpha=1.1, beta=10)  # Яркость/контраст
+        return frame
 
     def clear_buffer(self, num_frames: int = 10) -> None:
         """
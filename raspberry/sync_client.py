@@ -1,12 +1,37 @@
 import logging
-from typing import Any, Dict
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # falls back to requests' stdlib json
+    orjson = None
 
 from raspberry.config import PiSettings
 
 logger = logging.getLogger(__name__)
 
+# Parallel photo downloads during sync
+DOWNLOAD_WORKERS = 4
+
+# Events waiting for the background sender; new events are dropped while it is full
+EVENT_QUEUE_SIZE = 256
+# Longest pause of the sender after failed posts (doubles from 1s per failure)
+EVENT_MAX_BACKOFF_SEC = 60.0
+# Posts per event before it is dropped; a failed event goes back to the end of the queue
+EVENT_MAX_ATTEMPTS = 5
+
+# Keep-alive connection pool shared by sync, photo downloads and events: after the first
+# request the TCP/TLS handshake is skipped. Sized for DOWNLOAD_WORKERS concurrent downloads.
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=DOWNLOAD_WORKERS))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=DOWNLOAD_WORKERS))
+
 
 def _auth_headers(settings: PiSettings) -> dict:
     headers = {"X-Device-Id": settings.device_id}
@@ -15,25 +40,111 @@ def _auth_headers(settings: PiSettings) -> dict:
     return headers
 
 
-def fetch_sync_payload(settings: PiSettings) -> Dict[str, Any]:
+def fetch_sync_payload(settings: PiSettings, etag: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Args:
+        etag: ETag of the payload the device already has, sent as If-None-Match
+
+    Returns:
+        The sync payload, with the response ETag (if the server sends one) under "sync_etag";
+        None if the server answered 304 Not Modified
+    """
     url = f"{settings.api_base_url.rstrip('/')}/raspberry/sync"
-    resp = requests.get(url, headers=_auth_headers(settings), timeout=10)
+    headers = _auth_headers(settings)
+    if etag:
+        headers["If-None-Match"] = etag
+    resp = _SESSION.get(url, headers=headers, timeout=10)
+    if etag and resp.status_code == 304:
+        return None
     resp.raise_for_status()
-    return resp.json()
+    if orjson is not None:
+        # Parses straight from the response bytes, without decoding them to str first
+        payload = orjson.loads(resp.content)
+    else:
+        payload = resp.json()
+    if resp.headers.get("ETag"):
+        payload["sync_etag"] = resp.headers["ETag"]
+    return payload
 
 
-def fetch_photo(settings: PiSettings, url: str) -> bytes:
+def _photo_url(settings: PiSettings, url: str) -> str:
     if url.startswith("http://") or url.startswith("https://"):
-        full_url = url
-    else:
-        full_url = f"{settings.api_base_url.rstrip('/')}{url}"
-    resp = requests.get(full_url, headers=_auth_headers(settings), timeout=15)
+        return url
+    return f"{settings.api_base_url.rstrip('/')}{url}"
+
+
+def fetch_photo(settings: PiSettings, url: str) -> bytes:
+    resp = _SESSION.get(_photo_url(settings, url), headers=_auth_headers(settings), timeout=15)
     resp.raise_for_status()
     return resp.content
 
 
-def send_event(settings: PiSettings, payload: Dict[str, Any]) -> None:
+def fetch_photo_if_changed(settings: PiSettings, url: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Conditional photo download: with the ETag of the copy embedded last time, an unchanged
+    photo costs a 304 instead of the image.
+
+    Returns:
+        (photo bytes, response ETag), or (None, etag) if the photo is unchanged
+    """
+    headers = _auth_headers(settings)
+    if etag:
+        headers["If-None-Match"] = etag
+    resp = _SESSION.get(_photo_url(settings, url), headers=headers, timeout=15)
+    if etag and resp.status_code == 304:
+        return None, etag
+    resp.raise_for_status()
+    return resp.content, resp.headers.get("ETag")
+
+
+# (settings, payload, failed attempts so far)
+_events: "queue.Queue[Tuple[PiSettings, Dict[str, Any], int]]" = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+_sender: Optional[threading.Thread] = None
+_sender_lock = threading.Lock()
+
+
+def post_event(settings: PiSettings, payload: Dict[str, Any]) -> None:
+    """POST one access event and wait for the server."""
     url = f"{settings.api_base_url.rstrip('/')}/raspberry/events/log"
-    resp = requests.post(url, headers=_auth_headers(settings), json=payload, timeout=10)
+    resp = _SESSION.post(url, headers=_auth_headers(settings), json=payload, timeout=10)
     if resp.status_code >= 400:
         logger.warning("Failed to push event: %s %s", resp.status_code, resp.text)
+
+
+def send_event(settings: PiSettings, payload: Dict[str, Any]) -> None:
+    """
+    Queue an access event for the background sender and return immediately,
+    so the recognition thread never waits for the network. An event that fails to post
+    is retried after the rest of the queue, up to EVENT_MAX_ATTEMPTS times.
+    """
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = threading.Thread(target=_send_events, name="event-sender", daemon=True)
+            _sender.start()
+    try:
+        _events.put_nowait((settings, payload, 0))
+    except queue.Full:
+        logger.warning("Event queue full, dropping event: %s", payload.get("status"))
+
+
+def _send_events() -> None:
+    backoff = 0.0
+    while True:
+        settings, payload, attempts = _events.get()
+        try:
+            post_event(settings, payload)
+            backoff = 0.0
+        except Exception as exc:
+            attempts += 1
+            if attempts >= EVENT_MAX_ATTEMPTS:
+                logger.warning("Failed to push event, dropping it after %s attempts: %s", attempts, exc)
+            else:
+                logger.warning("Failed to push event (attempt %s), retrying later: %s", attempts, exc)
+                try:
+                    _events.put_nowait((settings, payload, attempts))
+                except queue.Full:
+                    logger.warning("Event queue full, dropping event: %s", payload.get("status"))
+            # Server unreachable: pause instead of failing every queued event at once
+            backoff = min(max(backoff * 2, 1.0), EVENT_MAX_BACKOFF_SEC)
+            time.sleep(backoff)
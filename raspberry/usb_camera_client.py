@@ -1,38 +1,220 @@
 import logging
-from typing import Optional, Tuple
+import time
+from typing import Optional, Union
 
 import cv2
+import numpy as np
+
+from jpeg_codec import encode_jpeg, encode_jpeg_into
 
 logger = logging.getLogger(__name__)
 
+# Extra reads after a failed one before the device is reopened (a reopen restarts the stream)
+READ_RETRIES = 2
+# Reopen attempts after the retries failed; the pause before each one doubles from RECONNECT_BACKOFF_SEC
+RECONNECT_ATTEMPTS = 3
+RECONNECT_BACKOFF_SEC = 0.5
+# At most one read-failure warning per this many seconds while the camera keeps failing
+WARN_INTERVAL_SEC = 5.0
+
 
 class USBCameraClient:
-    def __init__(self, device_index: int = 0):
+    """
+    USB (UVC) camera reader returning JPEG bytes.
+
+    The camera is opened through V4L2 and asked for MJPG. When it agrees, OpenCV's RGB
+    conversion is turned off and read_frame() hands out the JPEG produced by the camera's
+    on-chip encoder as-is, so the Pi neither decodes nor re-encodes the frame.
+    Cameras without MJPG support fall back to BGR frames encoded by jpeg_codec.encode_jpeg();
+    callers that want pixels rather than JPEG use read_raw() / read_frame_array(), which skip
+    that encode.
+    """
+
+    def __init__(self, device_index: int = 0, width: int = 0, height: int = 0, fps: int = 0, backend: int = cv2.CAP_V4L2):
+        """
+        Args:
+            device_index: /dev/videoN index
+            width, height, fps: Requested capture mode, set together with the format before the
+                first read so the driver negotiates the stream once (0 = camera default)
+            backend: OpenCV capture API. Naming it skips probing the other backends on every
+                (re)connect; override only off the Pi (e.g. cv2.CAP_AVFOUNDATION on macOS)
+        """
         self.device_index = device_index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.backend = backend
         self.capture: Optional[cv2.VideoCapture] = None
+        self.mjpeg = False
+        self._frame: Optional[np.ndarray] = None
+        self._last_warn = 0.0
 
     def connect(self) -> None:
-        self.capture = cv2.VideoCapture(self.device_index)
+        self.capture = cv2.VideoCapture(self.device_index, self.backend)
         if not self.capture.isOpened():
             raise RuntimeError(f"Unable to open USB camera at index {self.device_index}")
-        logger.info("USB camera connected: index=%s", self.device_index)
+        mjpg = cv2.VideoWriter_fourcc(*"MJPG")
+        self.capture.set(cv2.CAP_PROP_FOURCC, mjpg)
+        # Size and rate after the format: the camera may offer other modes for MJPG than for YUYV
+        if self.width and self.height:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+        self.mjpeg = int(self.capture.get(cv2.CAP_PROP_FOURCC)) == mjpg
+        if self.mjpeg:
+            # Keep frames compressed: read() returns the raw MJPEG buffer
+            self.mjpeg = bool(self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+        # One queued buffer: a read gets the newest frame, not one that waited in the driver
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        logger.info(
+            "USB camera connected: index=%s %dx%d@%s (mjpeg passthrough=%s)",
+            self.device_index,
+            int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            self.capture.get(cv2.CAP_PROP_FPS),
+            self.mjpeg,
+        )
 
-    def read_frame(self) -> Optional[Tuple[bool, bytes]]:
-        if not self.capture:
+    def _reopen(self) -> bool:
+        """
+        Release the device and open it again. Opening on top of an unreleased capture would
+        leak its descriptor and V4L2 buffers until the driver runs out of them.
+        """
+        delay = RECONNECT_BACKOFF_SEC
+        for attempt in range(1, RECONNECT_ATTEMPTS + 1):
+            self.release()
+            time.sleep(delay)
+            try:
+                self.connect()
+                return True
+            except RuntimeError as exc:
+                logger.warning("USB camera reopen %d/%d failed: %s", attempt, RECONNECT_ATTEMPTS, exc)
+                delay *= 2
+        return False
+
+    def _grab(self, reuse: bool) -> Optional[np.ndarray]:
+        """
+        Read one frame, retrying and then reconnecting on failure: the raw MJPEG buffer in passthrough mode,
+        a BGR frame otherwise. With reuse the frame lands in the previous frame's memory.
+        """
+        # Local binding; the connect-time check stays off the per-frame path
+        capture = self.capture
+        if capture is None:
             self.connect()
-        assert self.capture
-        ok, frame = self.capture.read()
+            capture = self.capture
+            assert capture  # connect() raises when the device does not open
+        # Passing the previous frame back lets OpenCV reuse its memory when the size matches
+        ok, frame = capture.read(self._frame if reuse else None)
+        retries = 0
+        # Most failures are a single dropped USB frame: the next read succeeds
+        while not ok and retries < READ_RETRIES:
+            retries += 1
+            ok, frame = capture.read()
+        if retries:
+            logger.debug("USB camera read needed %d retries (ok=%s)", retries, ok)
         if not ok:
-            logger.warning("USB camera frame read failed, reconnecting")
-            self.connect()
+            now = time.monotonic()
+            if now - self._last_warn >= WARN_INTERVAL_SEC:
+                self._last_warn = now
+                logger.warning("USB camera frame read failed %d times, reconnecting", retries + 1)
+            if not self._reopen():
+                return None
             ok, frame = self.capture.read()
         if not ok:
             return None
-        ret, buf = cv2.imencode(".jpg", frame)
-        if not ret:
+        if reuse:
+            self._frame = frame
+        return frame
+
+    @staticmethod
+    def _mjpeg_view(frame: np.ndarray) -> Optional[np.ndarray]:
+        data = frame.reshape(-1)
+        if data[:2].tobytes() != b"\xff\xd8":
+            logger.debug("Skipping corrupt MJPEG frame")
             return None
-        return True, buf.tobytes()
+        return data
+
+    def _read_jpeg(self) -> Optional[Union[np.ndarray, bytes]]:
+        """
+        Grab one frame as JPEG: a flat uint8 view of the capture buffer (MJPEG passthrough,
+        overwritten by the next read) or the bytes produced by the encoder.
+        """
+        frame = self._grab(reuse=True)
+        if frame is None:
+            return None
+        if self.mjpeg:
+            return self._mjpeg_view(frame)
+        # libjpeg-turbo (SIMD) when available; the result is a new bytes object already
+        return encode_jpeg(frame)
+
+    def read_raw(self) -> Optional[np.ndarray]:
+        """
+        Grab one BGR frame for on-device processing, skipping the JPEG encode of the
+        non-MJPEG path (MJPEG frames are decoded). The array is not reused by later reads.
+        """
+        if not self.capture:
+            self.connect()
+        # The MJPEG buffer is decoded into a new array, so only then can it be reused
+        frame = self._grab(reuse=self.mjpeg)
+        if frame is None or not self.mjpeg:
+            return frame
+        data = self._mjpeg_view(frame)
+        return None if data is None else cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+    def read_frame_array(self) -> Optional[np.ndarray]:
+        """read_raw() under the name FrameGrabber looks for (as on RTSPClient)."""
+        return self.read_raw()
+
+    def read_jpeg(self) -> Optional[bytes]:
+        data = self._read_jpeg()
+        if data is None:
+            return None
+        # The passthrough view must be copied out before the next read reuses the buffer
+        return data if isinstance(data, bytes) else data.tobytes()
+
+    def read_frame(self) -> Optional[bytes]:
+        """JPEG bytes of one frame, None if no frame was read."""
+        return self.read_jpeg()
+
+    def read_frame_into(self, out: bytearray) -> int:
+        """
+        Like read_frame(), but copy the JPEG into a caller-owned buffer instead of a new bytes object.
+
+        Returns:
+            Number of bytes written to out, 0 if no frame was read or it does not fit
+        """
+        if self.capture and not self.mjpeg:
+            # Encode straight into out instead of into a bytes object copied afterwards
+            frame = self._grab(reuse=True)
+            if frame is None:
+                return 0
+            size = encode_jpeg_into(frame, out)
+            if not size:
+                logger.warning("USB frame could not be encoded into %s byte buffer", len(out))
+            return size
+        data = self._read_jpeg()
+        if data is None:
+            return 0
+        size = len(data)
+        if size > len(out):
+            logger.warning("USB frame of %s bytes does not fit into %s byte buffer", size, len(out))
+            return 0
+        memoryview(out)[:size] = data
+        return size
+
+    def clear_buffer(self, num_frames: int = 1) -> None:
+        """
+        Discard frames with grab() only, so they are neither decoded nor encoded
+        (FrameGrabber uses it to skip frames).
+        """
+        if not self.capture:
+            return
+        for _ in range(num_frames):
+            self.capture.grab()
 
     def release(self) -> None:
         if self.capture:
             self.capture.release()
+        self.capture = None
+        self._frame = None